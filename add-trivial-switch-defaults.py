@@ -17,23 +17,30 @@
 '''
 #!/usr/bin/python
 
-from clangwrapper import HashableLocation, CursorKind
-from observer import traverse, Observer, printCursor, repeatedString
+from clangwrapper import CursorKind
+from observer import traverse, Observer, FileFilter, printCursor, repeatedString
+from fileprinter import printf, printerr
+from tokenindex import tokensFor
+from collections import defaultdict
 import fixer
+import seeds
 
 # Will find the parent of the //first// (uppermost) cursor for each location 
 # passed into its constructor.
-# The instance attribute 'cursors' is a dict from HashableLocation --> Cursor
+# The instance attribute 'cursors' is a dict from SourceLocation --> Cursor
+#
+# This is how the switches used to be found, by traversing everything in
+# the files with warnings. Kept around for comparison; see benchmark.py.
 #
 class FindCursorParent(Observer):
     def __init__(self, locations):
         super(FindCursorParent, self).__init__()
         self.locations = set(locations)
-        self.cursors = dict() # HashableLocation --> Cursor
+        self.cursors = dict() # SourceLocation --> Cursor
         self.parentStack = []
 
     def observe(self, cursor):
-        loc = HashableLocation(cursor.location)
+        loc = cursor.location
         parents = self.parentStack
         if len(parents) == 0:
             return # Can't get a parent if there aren't any.
@@ -52,7 +59,9 @@ class FindCursorParent(Observer):
 def firstWith(sequence, predicate, default=None):
     return next((x for x in sequence if predicate(x)), default)
 
-def getSwitchRewrite(switchCursor, printerr):
+# 'tokens' is a tokenindex.TranslationUnitTokens.
+#
+def getSwitchRewrite(switchCursor, tokens, printerr, noTodo=False):
     if switchCursor.kind != CursorKind.SWITCH_STMT:
         printerr('This cursor is a {} instead of a switch.',
                  switchCursor.kind)
@@ -79,9 +88,9 @@ def getSwitchRewrite(switchCursor, printerr):
         printerr("The body of this switch doesn't have any children. What the hell.")
         return None
 
-    bodyTokens = list(body.get_tokens())
+    bodyTokens = tokens.tokensOf(body)
     assert len(bodyTokens) > 1
-    offset = bodyTokens[-2].extent.end.offset
+    offset = bodyTokens[-2].endOffset
 
     def isCase(cursor):
         return cursor.kind == CursorKind.CASE_STMT
@@ -97,31 +106,71 @@ def getSwitchRewrite(switchCursor, printerr):
     return (offset, 0, '\n{0}default:\n{0}{1}break;{2}'.format(
                            indentation, 
                            repeatedString(' ', tabWidth),
-                           '' if args.noTodo else ' /* TODO? */'))
+                           '' if noTodo else ' /* TODO? */'))
 
-if __name__ == '__main__':
-    import fileprinter
-    printf = fileprinter.printf
-    printerr = fileprinter.printerr
-
-    util = fixer.Fixer("Add no-op 'default:' to incomplete switches on enum types.")
-    util.add_argument('--no-todo', dest='noTodo', action='count',
-                      help="Don't add a TODO comment to each inserted 'default:'")
-    args, transUnit = util.setup()
-    filepath = util.filepath
-
-    switchWarnLocations = set(HashableLocation(diag.location) \
+# The switches clang warned about (-Wswitch), each found by way of its
+# warning's location (see seeds.enclosingStatement) rather than by
+# traversing anything.
+#
+def warnedSwitches(transUnit):
+    switches = set()
+    for diag in seeds.diagnosticsFor(transUnit, '-Wswitch'):
+        switch = seeds.enclosingStatement(transUnit, diag.location,
+                                          (CursorKind.SWITCH_STMT,))
+        if switch is None:
+            printerr('WARNING Found no switch for this warning: {}', diag)
+            continue
+        switches.add(switch)
+    return switches
+
+# The old way: traverse the files that have warnings, looking for the
+# cursors at the warnings' locations. Kept around for comparison; see
+# benchmark.py.
+#
+def warnedSwitchesByTraversal(transUnit):
+    switchWarnLocations = set(diag.location \
                               for diag in transUnit.diagnostics \
                               if diag.option == '-Wswitch')
-
     finder = FindCursorParent(switchWarnLocations)
-    traverse(transUnit.cursor, finder)
+    warnedFiles = set(loc.file.name for loc in switchWarnLocations if loc.file)
+    traverse(transUnit.cursor, finder, FileFilter(warnedFiles))
+    return finder.cursors.values()
 
-    rewrites = [getSwitchRewrite(cursor, printerr) for cursor in finder.cursors.itervalues()]
+# A function that finds the switches clang warned about and turns them into
+# rewrites. There's nothing to traverse. See fixer.Pass.
+#
+def getPass(transUnit, args, registry=None):
+    def finish():
+        tokens = tokensFor(transUnit)
+        rewrites = defaultdict(list)
+        for cursor in warnedSwitches(transUnit):
+            rewrite = getSwitchRewrite(cursor, tokens, printerr, args.noTodo)
+            if rewrite is not None:
+                rewrites[cursor.fileName].append(rewrite)
+        return rewrites
+
+    return fixer.Pass(Observer(), finish, FileFilter([]))
+
+# The switches are in function bodies, and the -Wswitch warnings about
+# switches in templates come from instantiating them, which clang does at
+# the end of the translation unit.
+#
+parseNeeds = set([fixer.FUNCTION_BODIES, fixer.END_OF_UNIT])
+
+# Find the incomplete switches in a translation unit.
+# Returns a dict of filename --> list of rewrites.
+#
+def findRewrites(transUnit, args):
+    return fixer.runPasses(transUnit, [getPass(transUnit, args)])
+
+if __name__ == '__main__':
+    util = fixer.Fixer("Add no-op 'default:' to incomplete switches on enum types.",
+                       parseNeeds)
+    util.add_argument('--no-todo', dest='noTodo', action='count',
+                      help="Don't add a TODO comment to each inserted 'default:'")
+    util.setup()
 
-    if len(rewrites) > 0:
-        fin = open(filepath, 'r')
-        fout = open(filepath + '.rewrite', 'w')
-        from rewrite import rewrite
-        rewrite(fin, fout, rewrites)
+    def fix(args, transUnit):
+        util.writeRewrites(findRewrites(transUnit, args), printf)
 
+    util.run(fix)
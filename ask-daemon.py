@@ -0,0 +1,78 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+# A thin client for run-daemon.py. It takes the same arguments as the scripts
+# it stands in for:
+#
+#     ask-daemon.py fix foo.cpp --flags-file flags    (like fix-all.py)
+#     ask-daemon.py print foo.cpp --flags-file flags  (like print-ast.py)
+#     ask-daemon.py show foo.cpp --flags-file flags   (like show-warnings.py)
+#
+
+import argparse
+import os
+import sys
+import daemon
+import fixer
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ask a running fixer daemon to fix, '
+                                                 'print, or show warnings for a C++ file.')
+    parser.add_argument('command', choices=daemon.commands,
+                        help='fix: run the fixers; print: print the AST; '
+                             'show: print the diagnostics.')
+    parser.add_argument('file', type=str,
+                        help='The source file to analyze and rewrite.')
+    parser.add_argument('--flags-file', dest='flagsFile', action='store',
+                        help='Path to a file containing clang compiler flags separated by newlines.')
+    parser.add_argument('--fixer', dest='fixers', action='append',
+                        choices=fixer.fixerNames,
+                        help='Run only this fixer. May be repeated. Default is all of them.')
+    parser.add_argument('--no-todo', dest='noTodo', action='count',
+                        help="Don't add a TODO comment to each inserted 'default:'")
+    parser.add_argument('--in-place', dest='inPlace', action='count',
+                        help='Overwrite the file itself (atomically) instead of writing '
+                             '<file>.rewrite next to it.')
+    parser.add_argument('--diff', dest='diff', action='count',
+                        help="Don't rewrite anything; print a unified diff of the "
+                             "rewrites instead.")
+    parser.add_argument('--headers', dest='headers', action='count',
+                        help='Rewrite the (non-system) headers that the file includes, '
+                             'not just the file itself.')
+    parser.add_argument('--ignore-errors', dest='ignoreErrors', action='count',
+                        help="Don't quit after encountering a compiler error.")
+    parser.add_argument('--socket', default=daemon.defaultSocketPath(),
+                        help='Path of the socket the daemon is listening on.')
+    args = parser.parse_args()
+
+    response = daemon.ask(args.socket, {
+        'command': args.command,
+        'file': args.file,
+        'cwd': os.getcwd(),
+        'flags': fixer.getFlagsFromFile(args.flagsFile) if args.flagsFile else [],
+        'fixers': args.fixers,
+        'noTodo': bool(args.noTodo),
+        'inPlace': bool(args.inPlace),
+        'diff': bool(args.diff),
+        'headers': bool(args.headers),
+        'ignoreErrors': bool(args.ignoreErrors)})
+
+    sys.stdout.write(response['output'].encode('utf-8'))
+    sys.stderr.write(response['diagnostics'].encode('utf-8'))
+    sys.exit(0 if response['ok'] else 1)
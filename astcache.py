@@ -0,0 +1,159 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+# An on-disk cache of parsed translation units, so that running a script
+# again on a file that hasn't changed loads the AST clang saved last time
+# (TranslationUnit.save / from_ast_file) instead of parsing all over again.
+#
+# Each entry is a pair of files in the cache directory:
+#     <key>.ast  -- the saved translation unit
+#     <key>.json -- what it was built from: a hash of the contents of the
+#                   main file and of every file it included
+# where <key> is a hash of the main file's path, the compiler flags, the
+# parse options, the working directory, and the libclang version. An entry is only used if all
+# of the file hashes still match.
+#
+# Diagnostics don't survive the trip through an AST file, and the fixers need
+# them, so translation units with any diagnostics aren't cached.
+#
+# When the .ast files together exceed the size limit, the least recently
+# used entries are evicted. Using an entry touches its .ast file, so
+# modification time is "last used" time.
+#
+
+import hashlib
+import json
+import os
+import tempfile
+
+import clangwrapper # for the side effect of telling clang where libclang is
+from clang.cindex import TranslationUnit, TranslationUnitLoadError, \
+                         TranslationUnitSaveError, conf
+
+def hashFile(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def libclangVersion():
+    return conf.lib.clang_getClangVersion()
+
+class AstCache(object):
+    def __init__(self, directory, maxBytes):
+        # Absolute, since batch jobs chdir to each compile command's directory.
+        self.directory = os.path.abspath(directory)
+        self.maxBytes = maxBytes
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _key(self, filepath, flags, options):
+        identity = json.dumps([os.path.abspath(filepath),
+                               list(flags),
+                               options,
+                               os.getcwd(),
+                               libclangVersion()])
+        return hashlib.sha1(identity).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.ast', base + '.json'
+
+    # Returns the cached translation unit, or None if there isn't an
+    # up-to-date one.
+    #
+    def get(self, filepath, flags, index, options=0):
+        astPath, manifestPath = self._paths(self._key(filepath, flags, options))
+        try:
+            with open(manifestPath, 'r') as file:
+                manifest = json.load(file)
+            for path, digest in manifest['hashes'].iteritems():
+                if hashFile(path) != digest:
+                    return None
+            transUnit = TranslationUnit.from_ast_file(astPath, index)
+        except (IOError, OSError, ValueError, KeyError, TranslationUnitLoadError):
+            return None
+
+        os.utime(astPath, None)
+        return transUnit
+
+    def put(self, filepath, flags, transUnit, options=0):
+        if len(transUnit.diagnostics) > 0:
+            return
+
+        hashes = dict((path, hashFile(path)) for path in sourcesOf(filepath, transUnit))
+        astPath, manifestPath = self._paths(self._key(filepath, flags, options))
+
+        # Write to temporary files and rename them into place, so that other
+        # processes sharing the cache never see half of an entry.
+        try:
+            astTemp = _tempPathIn(self.directory, '.ast')
+            transUnit.save(astTemp)
+            os.rename(astTemp, astPath)
+
+            manifestTemp = _tempPathIn(self.directory, '.json')
+            with open(manifestTemp, 'w') as file:
+                json.dump({'file': filepath, 'hashes': hashes}, file)
+            os.rename(manifestTemp, manifestPath)
+        except (IOError, OSError, TranslationUnitSaveError):
+            return
+
+        self.evict()
+
+    # Remove least recently used entries until the cache fits in maxBytes.
+    #
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.ast'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # Evicted by someone else.
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, astPath in entries:
+            if total <= self.maxBytes:
+                break
+            manifestPath = astPath[:-len('.ast')] + '.json'
+            for path in (manifestPath, astPath):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+# The main file and everything it includes, directly or not.
+#
+def sourcesOf(filepath, transUnit):
+    sources = set([filepath])
+    for inclusion in transUnit.get_includes():
+        sources.add(inclusion.include.name)
+    return sources
+
+def _tempPathIn(directory, suffix):
+    descriptor, path = tempfile.mkstemp(suffix=suffix + '.tmp', dir=directory)
+    os.close(descriptor)
+    return path
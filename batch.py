@@ -0,0 +1,464 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Running the fixers over a whole compilation database (compile_commands.json)
+# instead of one file per process. Translation units are farmed out to a pool
+# of worker processes, each of which loads libclang and creates an Index once,
+# and then reuses them for every translation unit it's handed.
+#
+
+import argparse
+import multiprocessing
+import os
+import time
+from collections import defaultdict, namedtuple
+from StringIO import StringIO
+
+import fileprinter
+import fixer
+import changes
+import incremental
+from astcache import sourcesOf
+from clangwrapper import CompilationDatabase, Diagnostic, Index, \
+                         TranslationUnitLoadError
+from includegraph import IncludeGraph, OwnerFilter
+from registry import Registry
+from rewrite import writeRewrites, RewriteConflictError
+
+sourceExtensions = ('.cpp', '.cc', '.cxx', '.c++', '.C', '.c')
+
+# A compile command as it comes out of the database includes the compiler,
+# the source file, and output options, none of which clang wants from us.
+# -Werror is dropped too, since it turns the very warnings we're looking for
+# into errors.
+#
+def _splitCompileCommand(arguments):
+    flags = []
+    sources = []
+    arguments = iter(arguments)
+    next(arguments, None) # the compiler itself
+    for arg in arguments:
+        if arg == '-o':
+            next(arguments, None)
+        elif arg in ('-c', '-Werror'):
+            continue
+        elif not arg.startswith('-') and arg.endswith(sourceExtensions):
+            sources.append(arg)
+        else:
+            flags.append(arg)
+    return flags, sources
+
+# A job is everything a worker needs to know to handle one translation unit:
+#     (directory, filepath, flags)
+# It has to be picklable, so no libclang objects allowed.
+#
+def getJobs(buildDir):
+    database = CompilationDatabase.fromDirectory(buildDir)
+    commands = database.getAllCompileCommands() or []
+    jobs = []
+    seen = set()
+    for command in commands:
+        flags, sources = _splitCompileCommand(command.arguments)
+        for source in sources:
+            key = (command.directory, source)
+            if key in seen:
+                continue
+            seen.add(key)
+            jobs.append((command.directory, source, flags))
+    return jobs
+
+# Per-process state, set up once by _initWorker.
+#
+_index = None
+_astCache = None
+_diffBase = None # what paths in diffs are relative to
+_registry = None
+_owners = None # header --> key of the translation unit that deals with it
+_hashes = incremental.FileHashes()
+
+def _initWorker(args, diffBase, sharedRegistry, owners):
+    global _index, _astCache, _diffBase, _registry, _owners
+    _index = Index.create()
+    _astCache = fixer.getAstCache(args)
+    _diffBase = diffBase
+    _registry = Registry(sharedRegistry) if args.skipSeen else None
+    _owners = owners
+
+# What became of one job:
+#    - filepath: its main file.
+#    - rewrites: how many rewrites were found for the main file.
+#    - error: an error message, or None.
+#    - seconds: how long it took.
+#    - diff: the unified diff of the main file, with --diff (else '').
+#    - headerRewrites: with --headers, a dict of header (by real path)
+#      --> list of rewrites, to be applied once the whole batch is done.
+#    - key: see incremental.unitKey.
+#    - sources: with --state (and without --diff), the hashes of the main
+#      file and everything it includes (see incremental.hashSources), else
+#      None.
+#    - includes: with --include-index, the absolute paths of the main file
+#      and everything it includes, else None.
+#
+Result = namedtuple('Result', ['filepath', 'rewrites', 'error', 'seconds',
+                               'diff', 'headerRewrites', 'key', 'sources',
+                               'includes'])
+
+def _failed(directory, filepath, error, start):
+    if _registry is not None:
+        _registry.discard()
+    return Result(filepath, 0, error, time.time() - start, '', {},
+                  incremental.unitKey(directory, filepath), None, None)
+
+# Parse one translation unit and run each of the named fixers over it in a
+# single traversal. The main file is rewritten here and now; rewrites of
+# headers are handed back, since other translation units will have a say.
+#
+def _runJob(job, args):
+    directory, filepath, flags = job
+    start = time.time()
+    try:
+        os.chdir(directory)
+        modules = fixer.loadFixers(args.fixers or fixer.fixerNames)
+        transUnit = fixer.getTranslationUnit(filepath,
+                                             fixer.getParseFlags(flags, args),
+                                             _index,
+                                             _astCache,
+                                             fixer.parseOptionsFor(fixer.parseNeedsOf(modules, args)))
+        didFindError = fixer.printErrors(transUnit, fileprinter.printerr) \
+                       if args.verbose else _hasErrors(transUnit)
+        if didFindError and not args.ignoreErrors:
+            return _failed(directory, filepath, 'errors in translation unit', start)
+
+        # With --headers and an include index, leave the functions in each
+        # header to the translation unit that owns it.
+        key = incremental.unitKey(directory, filepath)
+        wrapFilter = None
+        if _owners:
+            wrapFilter = lambda fileFilter: OwnerFilter(fileFilter, _owners, key)
+
+        rewritesByFile = fixer.runPasses(transUnit,
+                                         [module.getPass(transUnit, args, _registry) \
+                                          for module in modules],
+                                         _registry,
+                                         wrapFilter)
+
+        printf = fileprinter.printf if args.verbose else _doNothing
+        diff = StringIO() if args.diff else None
+        writeRewrites(rewritesByFile, [filepath], printf,
+                      inPlace=args.inPlace, diffFile=diff, diffBase=_diffBase)
+        count = len(rewritesByFile.get(filepath, []))
+
+        headerRewrites = {}
+        if args.headers:
+            for filename, rewrites in rewritesByFile.iteritems():
+                if filename != filepath and rewrites:
+                    headerRewrites[os.path.realpath(filename)] = rewrites
+    except TranslationUnitLoadError as error:
+        return _failed(directory, filepath, 'unable to parse: {}'.format(error), start)
+    except Exception as error:
+        return _failed(directory, filepath, '{}: {}'.format(type(error).__name__, error), start)
+
+    if _registry is not None:
+        _registry.commit()
+
+    # The files are hashed after the main file has been rewritten, so that
+    # it's the fixed version that the next run compares against.
+    return Result(filepath, count, None, time.time() - start,
+                  diff.getvalue() if diff is not None else '',
+                  headerRewrites,
+                  key,
+                  incremental.hashSources(filepath, transUnit, _hashes) \
+                      if args.state and not args.diff else None,
+                  [os.path.abspath(source) for source in sourcesOf(filepath, transUnit)] \
+                      if args.includeIndex else None)
+
+# Pool.imap wants a function of one argument.
+#
+def _runJobWithArgs(jobAndArgs):
+    return _runJob(*jobAndArgs)
+
+def _hasErrors(transUnit):
+    return any(diag.severity >= Diagnostic.Error
+               for diag in transUnit.diagnostics)
+
+def _doNothing(*args, **kwargs):
+    pass
+
+# The rewrites of headers found across a batch. The same header is usually
+# included by many translation units, each of which finds the same rewrites
+# in it, so they're kept as a set per header: each distinct rewrite is
+# applied once, after every translation unit has been heard from. Rewrites
+# that different translation units disagree about (a header can be seen
+# differently depending on what was #defined before it) are conflicts, and
+# that header is left alone.
+#
+class HeaderRewrites(object):
+    def __init__(self):
+        self.rewritesByFile = defaultdict(set) # real path --> set of rewrites
+
+    def add(self, headerRewrites):
+        for filename, rewrites in headerRewrites.iteritems():
+            self.rewritesByFile[filename].update(rewrites)
+
+    # Returns the number of headers written (or diffed), and a list of
+    # (header, error message) for those that had conflicts.
+    #
+    def write(self, printf, inPlace=False, diffFile=None, diffBase=None):
+        written = 0
+        failures = []
+        for filename in sorted(self.rewritesByFile):
+            rewrites = sorted(self.rewritesByFile[filename])
+            try:
+                written += len(writeRewrites({filename: rewrites}, None, printf,
+                                             inPlace=inPlace,
+                                             diffFile=diffFile,
+                                             diffBase=diffBase))
+            except (RewriteConflictError, IOError, OSError) as error:
+                failures.append((filename, str(error)))
+        return written, failures
+
+class Summary(object):
+    def __init__(self):
+        self.translationUnits = 0
+        self.rewrites = 0
+        self.headers = 0
+        self.failures = []
+        self.seconds = 0.0
+        self.state = None # an incremental.State, with --state
+        self.unaffected = None # with --changed, how many jobs weren't
+        self.unowned = [] # headers whose owner failed (see IncludeGraph.owners)
+
+    def add(self, result):
+        self.translationUnits += 1
+        self.rewrites += result.rewrites
+        if result.error is not None:
+            self.failures.append((result.filepath, result.error))
+
+    def throughput(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.translationUnits / self.seconds
+
+    def report(self, printf):
+        for filepath, error in self.failures:
+            printf('FAILED {}: {}', filepath, error)
+        for header in self.unowned:
+            printf('SKIPPED {}: the translation unit that was to analyze its '
+                   'functions failed', header)
+        printf('{} translation units ({} failed), {} rewrites, {} headers rewritten '
+               'in {:.1f} seconds ({:.2f} TUs/sec)',
+               self.translationUnits,
+               len(self.failures),
+               self.rewrites,
+               self.headers,
+               self.seconds,
+               self.throughput())
+        if self.unaffected is not None:
+            printf('{} not affected by the changes (skipped)', self.unaffected)
+        if self.state is not None:
+            printf('{} unchanged since the last run (skipped), {} changed',
+                   self.state.hits, self.state.misses)
+
+def _jobKey(job):
+    directory, filepath, _ = job
+    return incremental.unitKey(directory, filepath)
+
+# The jobs affected by the git revision range 'revisions'. What each
+# translation unit includes comes from the include index if there is one,
+# else from the state file, so translation units that aren't in there are
+# always affected.
+#
+def _jobsAffectedBy(revisions, jobs, summary, graph, printf):
+    if graph is None and summary.state is None:
+        printf('WARNING Without --include-index or --state, there is no way to tell '
+               'which translation units include which headers, so all of them will '
+               'be run.')
+    if graph is None:
+        sourcesByUnit = {}
+        if summary.state is not None:
+            sourcesByUnit = dict((key, unit['hashes'].keys()) \
+                                 for key, unit in summary.state.units.iteritems())
+        graph = changes.ReverseIncludeGraph(sourcesByUnit)
+
+    affected = changes.affectedJobs(jobs,
+                                    changes.changedFiles(revisions),
+                                    graph,
+                                    _jobKey)
+    summary.unaffected = len(jobs) - len(affected)
+    return affected
+
+# Run the jobs across a pool of 'processes' workers (or in this process,
+# if processes is 1, which is handy when debugging). With --diff, the diffs
+# of all of the translation units go to 'diffFile', as one patch. With
+# --headers, the headers are rewritten once all of the jobs are done. With
+# --changed, only the jobs affected by those changes are run. With --state,
+# jobs that haven't changed since the last run are skipped, and the state
+# file is updated at the end. With --include-index, the index is used for
+# --changed, and for --headers each header's functions are analyzed by just
+# one of the translation units that include it; the index is updated with
+# what the jobs included at the end.
+#
+def run(jobs, args, processes, printf=fileprinter.printf, diffFile=None):
+    summary = Summary()
+    headers = HeaderRewrites()
+    base = os.getcwd() # the jobs chdir all over the place
+    start = time.time()
+
+    settings = None
+    graph = None
+    if args.state:
+        summary.state = incremental.State(args.state)
+        settings = incremental.settingsOf(args)
+    if args.includeIndex:
+        graph = IncludeGraph.loadOrCreate(args.includeIndex)
+    if args.changed:
+        jobs = _jobsAffectedBy(args.changed, jobs, summary, graph, printf)
+    if args.state:
+        jobs = [job for job in jobs \
+                if not summary.state.isUnchanged(_jobKey(job), job[2], settings)]
+    flagsByKey = dict((_jobKey(job), job[2]) for job in jobs)
+    owners = None
+    if graph is not None and args.headers:
+        owners = graph.owners(flagsByKey, flagsByKey)
+    work = [(job, args) for job in jobs]
+
+    manager = None
+    if processes == 1:
+        _initWorker(args, base, None, owners)
+        results = (_runJobWithArgs(item) for item in work)
+        pool = None
+    else:
+        # With --skip-seen, the workers share what they've seen through a
+        # dict living in a manager process.
+        sharedRegistry = None
+        if args.skipSeen:
+            manager = multiprocessing.Manager()
+            sharedRegistry = manager.dict()
+        pool = multiprocessing.Pool(processes, initializer=_initWorker,
+                                    initargs=(args, base, sharedRegistry, owners))
+        results = pool.imap_unordered(_runJobWithArgs, work)
+
+    failedKeys = set()
+    try:
+        for result in results:
+            summary.add(result)
+            if result.error is not None:
+                failedKeys.add(result.key)
+            headers.add(result.headerRewrites)
+            if result.sources is not None:
+                summary.state.record(result.key, flagsByKey[result.key], settings,
+                                     result.sources)
+            if result.includes is not None:
+                graph.setUnit(result.key, flagsByKey[result.key], result.includes)
+            if diffFile is not None:
+                diffFile.write(result.diff)
+            if args.verbose:
+                printf('{} ({} rewrites, {:.2f} seconds)',
+                       result.filepath, result.rewrites, result.seconds)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if manager is not None:
+            manager.shutdown()
+
+    # The other translation units that include a header left its functions
+    # to its owner, so if the owner failed, nobody analyzed them.
+    if owners:
+        summary.unowned = sorted(header for header, owner in owners.iteritems() \
+                                 if owner in failedKeys)
+
+    # Headers rewritten in place have changed since the translation units
+    # that include them were hashed.
+    rehash = summary.state is not None and args.inPlace
+    if rehash:
+        before = incremental.FileHashes()
+        for filename in headers.rewritesByFile:
+            before(filename)
+
+    summary.headers, failures = headers.write(printf if args.verbose else _doNothing,
+                                              inPlace=args.inPlace,
+                                              diffFile=diffFile,
+                                              diffBase=base)
+    summary.failures.extend(failures)
+    if rehash:
+        after = incremental.FileHashes()
+        summary.state.rewritten(dict((filename, (before(filename), after(filename))) \
+                                     for filename in headers.rewritesByFile \
+                                     if before(filename) != after(filename)))
+    if summary.state is not None:
+        summary.state.save()
+    if graph is not None:
+        graph.save(os.path.join(base, args.includeIndex))
+    summary.seconds = time.time() - start
+    return summary
+
+# Same idea as fixer.Fixer, but the positional argument is a build directory
+# containing compile_commands.json rather than a single source file.
+#
+class BatchFixer(object):
+    def __init__(self, description):
+        self._parser = argparse.ArgumentParser(description=description)
+        _addDefaultArgs(self._parser)
+
+    def add_argument(self, *args, **kwargs):
+        self._parser.add_argument(*args, **kwargs)
+
+    def setup(self):
+        self.args = self._parser.parse_args()
+        self.jobs = getJobs(self.args.buildDir)
+        return self.args, self.jobs
+
+def _addDefaultArgs(parser):
+    parser.add_argument('buildDir', type=str,
+                        help='Directory containing compile_commands.json.')
+    parser.add_argument('--fixer', dest='fixers', action='append',
+                        choices=fixer.fixerNames,
+                        help='Run only this fixer. May be repeated. Default is all of them.')
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='Number of worker processes.')
+    parser.add_argument('--no-todo', dest='noTodo', action='count',
+                        help="Don't add a TODO comment to each inserted 'default:'")
+    parser.add_argument('--verbose', '-v', action='count',
+                        help='Log to stdout verbosely.')
+    parser.add_argument('--ignore-errors', dest='ignoreErrors', action='count',
+                        help="Don't skip translation units that have compiler errors.")
+    parser.add_argument('--state', dest='state', action='store',
+                        help='State file for incremental runs: translation units that, '
+                             'along with everything they include, are unchanged since '
+                             'the run that wrote it are skipped.')
+    parser.add_argument('--changed', dest='changed', action='store', metavar='REVISIONS',
+                        help='Only run the translation units affected by the files that '
+                             'changed in this git revision range (e.g. master..HEAD), '
+                             'including those that include a changed header. Which '
+                             'headers each translation unit includes is taken from '
+                             '--include-index, or else from --state.')
+    parser.add_argument('--include-index', dest='includeIndex', action='store',
+                        metavar='FILE',
+                        help='Index of which translation units include which files '
+                             '(see index-includes.py), updated at the end of the run. '
+                             'With --headers, the functions in each header are analyzed '
+                             'by only one of the translation units that include it.')
+    parser.add_argument('--skip-seen', dest='skipSeen', action='count',
+                        help='Analyze each definition in a header once for the whole '
+                             'batch, rather than once per translation unit that '
+                             'includes it.')
+    fixer.addSeedArgs(parser)
+    fixer.addAstCacheArgs(parser)
+    fixer.addRewriteArgs(parser)
@@ -0,0 +1,501 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+# Timings for the hot spots of these scripts, so that changes meant to make
+# them faster can be checked. Run one benchmark, or all of them, like:
+#
+#     benchmark.py traverse path/to/file.cpp --flags-file path/to/flags
+#     benchmark.py all path/to/file.cpp
+#
+# Benchmarks that need a translation unit parse 'file' with the given flags.
+# Those that generate their own input ignore it.
+#
+
+import argparse
+import importlib
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter, OrderedDict
+
+import fixer
+import rewrite
+from clangwrapper import CursorKind, HashableCursor, HashableLocation
+from clang.cindex import conf, functionList
+from fileprinter import printf
+from tokenindex import TranslationUnitTokens
+from observer import Observer, FileFilter, traverse, recursiveTraverse
+
+# name --> (function(args, printf), needsFile)
+#
+benchmarks = OrderedDict()
+
+def benchmark(name, needsFile=True):
+    def register(function):
+        benchmarks[name] = (function, needsFile)
+        return function
+    return register
+
+# Call function(*args) 'repeat' times. Returns the fastest time in seconds
+# and the result of the last call.
+#
+def bestOf(repeat, function, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def report(printf, label, seconds, note=''):
+    printf('{:<45}{:>10.4f} s  {}', label, seconds, note)
+
+def parse(args):
+    flags = fixer.getFlagsFromFile(args.flagsFile) if args.flagsFile else []
+    return fixer.getTranslationUnit(args.file, fixer.hardcodedFlags + flags)
+
+class CountingObserver(Observer):
+    def __init__(self):
+        super(CountingObserver, self).__init__()
+        self.count = 0
+
+    def observe(self, cursor):
+        self.count += 1
+
+def countCursors(traversal, cursor, *args):
+    counter = CountingObserver()
+    traversal(cursor, counter, *args)
+    return counter.count
+
+@benchmark('traverse')
+def traverseBenchmark(args, printf):
+    transUnit = parse(args)
+    for label, traversal, extra in [
+            ('observer.recursiveTraverse', recursiveTraverse, ()),
+            ('observer.traverse', traverse, ()),
+            ('observer.traverse, no system headers', traverse, (FileFilter(),)),
+            ('observer.traverse, main file only', traverse, (FileFilter([args.file]),))]:
+        seconds, count = bestOf(args.repeat, countCursors, traversal, transUnit.cursor, *extra)
+        report(printf, label, seconds, '{} cursors'.format(count))
+
+class CursorCollector(Observer):
+    def __init__(self, kinds):
+        super(CursorCollector, self).__init__()
+        self.kinds = kinds
+        self.cursors = []
+
+    def observe(self, cursor):
+        if cursor.kind in self.kinds:
+            self.cursors.append(cursor)
+
+def cursorsOfKinds(transUnit, kinds, fileFilter=None):
+    collector = CursorCollector(kinds)
+    traverse(transUnit.cursor, collector, fileFilter)
+    return collector.cursors
+
+def spellingsFromCursors(cursors):
+    return [[token.spelling for token in cursor.get_tokens()] for cursor in cursors]
+
+def spellingsFromIndex(transUnit, cursors):
+    tokens = TranslationUnitTokens(transUnit)
+    return [[token.spelling for token in tokens.tokensOf(cursor)] for cursor in cursors]
+
+# The cursors whose tokens the fixers look at: constructors (fix-init-order),
+# parameters (remove-unused-parameters), and bodies (add-trivial-switch-defaults).
+#
+@benchmark('tokens')
+def tokensBenchmark(args, printf):
+    transUnit = parse(args)
+    cursors = cursorsOfKinds(transUnit,
+                             [CursorKind.CONSTRUCTOR,
+                              CursorKind.PARM_DECL,
+                              CursorKind.COMPOUND_STMT],
+                             FileFilter([args.file]))
+    note = '{} cursors'.format(len(cursors))
+
+    seconds, fromCursors = bestOf(args.repeat, spellingsFromCursors, cursors)
+    report(printf, 'Cursor.get_tokens', seconds, note)
+    seconds, fromIndex = bestOf(args.repeat, spellingsFromIndex, transUnit, cursors)
+    report(printf, 'TranslationUnitTokens.tokensOf', seconds, note)
+
+    if fromCursors != fromIndex:
+        printf('WARNING The two disagree about the tokens of some cursors.')
+
+# A class with 'count' members, and a constructor that initializes them in
+# the reverse order, so that every initializer has to move.
+#
+def generateConstructor(count):
+    members = ['m{}'.format(i) for i in range(count)]
+    lines = ['class C', '{']
+    lines += ['    int {};'.format(member) for member in members]
+    lines += ['  public:', '    C();', '};', '', 'C::C()']
+    initializers = ['{}({})'.format(member, i) for i, member in enumerate(members)]
+    lines.append(': ' + '\n, '.join(reversed(initializers)))
+    lines += ['{', '}', '']
+    return '\n'.join(lines)
+
+def writeTempSource(text):
+    descriptor, path = tempfile.mkstemp(suffix='.cpp')
+    with os.fdopen(descriptor, 'w') as file:
+        file.write(text)
+    return path
+
+# The old way of finding the tokens between consecutive member initializers:
+# scan all of the constructor's tokens for each one, via libclang.
+#
+def tokensBetweenByScanning(constructor, members):
+    tokens = list(constructor.get_tokens())
+    found = 0
+    for previous, current in zip(members, members[1:]):
+        begin = previous.extent.start.offset
+        end = current.extent.start.offset
+        found += len([token for token in tokens \
+                      if begin <= token.extent.start.offset <= end])
+    return found
+
+# The new way: bisect the constructor's file's TokenIndex.
+#
+def tokensBetweenByBisecting(transUnit, constructor, members):
+    tokens = TranslationUnitTokens(transUnit).indexOf(constructor.location.file.name)
+    found = 0
+    offsets = [member.extent.start.offset for member in members]
+    for begin, end in zip(offsets, offsets[1:]):
+        first, last = tokens.indicesStartingBetween(begin, end)
+        found += last - first
+    return found
+
+@benchmark('init-order', needsFile=False)
+def initOrderBenchmark(args, printf):
+    path = writeTempSource(generateConstructor(args.size))
+    try:
+        transUnit = fixer.getTranslationUnit(path, fixer.hardcodedFlags)
+        constructor = cursorsOfKinds(transUnit, [CursorKind.CONSTRUCTOR])[-1]
+        members = cursorsOfKinds(transUnit, [CursorKind.MEMBER_REF])
+        note = '{} initializers'.format(len(members))
+
+        seconds, _ = bestOf(args.repeat, tokensBetweenByScanning, constructor, members)
+        report(printf, 'tokens between initializers, scanning', seconds, note)
+        seconds, _ = bestOf(args.repeat, tokensBetweenByBisecting,
+                            transUnit, constructor, members)
+        report(printf, 'tokens between initializers, bisecting', seconds, note)
+
+        initOrder = importlib.import_module('fix-init-order')
+        fixerArgs = argparse.Namespace(verbose=None, fromDiagnostics=None)
+        seconds, rewrites = bestOf(args.repeat, initOrder.findRewrites, transUnit, fixerArgs)
+        report(printf, 'fix-init-order findRewrites', seconds,
+               '{} rewrites'.format(sum(len(r) for r in rewrites.itervalues())))
+    finally:
+        os.remove(path)
+
+# A header with 'count' functions, each with a switch that handles every
+# case, and a main file that includes it and has one switch that doesn't.
+# Returns the header's text and the main file's text.
+#
+def generateSwitches(count, headerName):
+    header = ['enum Color { RED, GREEN, BLUE };', '']
+    for i in range(count):
+        header += ['inline int f{}(Color c)'.format(i),
+                   '{',
+                   '    switch (c) {',
+                   '    case RED: return 1;',
+                   '    case GREEN: return 2;',
+                   '    case BLUE: return 3;',
+                   '    }',
+                   '    return 0;',
+                   '}',
+                   '']
+    main = ['#include "{}"'.format(headerName),
+            '',
+            'int g(Color c)',
+            '{',
+            '    switch (c) {',
+            '    case RED:',
+            '        return 1;',
+            '    }',
+            '    return 0;',
+            '}',
+            '']
+    return '\n'.join(header), '\n'.join(main)
+
+# Finding the switch that -Wswitch warns about in the main file, with ever
+# bigger headers: by traversing the files with warnings (the old way), and
+# by going from the warning's location to the switch (the new way). The old
+# way still looks at every top-level declaration in the header, to see
+# which file it's in; the new way doesn't look at the header at all.
+#
+@benchmark('switch', needsFile=False)
+def switchBenchmark(args, printf):
+    switches = importlib.import_module('add-trivial-switch-defaults')
+    directory = tempfile.mkdtemp()
+    try:
+        for count in (args.size, 4 * args.size, 16 * args.size):
+            header, main = generateSwitches(count, 'colors.h')
+            with open(os.path.join(directory, 'colors.h'), 'w') as file:
+                file.write(header)
+            path = os.path.join(directory, 'main.cpp')
+            with open(path, 'w') as file:
+                file.write(main)
+
+            transUnit = fixer.getTranslationUnit(path, fixer.hardcodedFlags)
+            note = '{} functions in the header'.format(count)
+            seconds, old = bestOf(args.repeat, switches.warnedSwitchesByTraversal, transUnit)
+            report(printf, 'switches by traversal', seconds, note)
+            seconds, new = bestOf(args.repeat, switches.warnedSwitches, transUnit)
+            report(printf, 'switches by location', seconds, note)
+
+            if sorted(c.extent.start.offset for c in old) != \
+               sorted(c.extent.start.offset for c in new):
+                printf('WARNING The two disagree about the switches.')
+    finally:
+        shutil.rmtree(directory)
+
+class RawCursorCollector(Observer):
+    def __init__(self):
+        super(RawCursorCollector, self).__init__()
+        self.cursors = []
+
+    def observe(self, cursor):
+        self.cursors.append(getattr(cursor, 'cursor', cursor))
+
+# What the fixers do with dicts, e.g. remove-unused-parameters counting
+# mentions of each parameter, and fix-init-order looking up the order of each
+# initialized field: key a dict by every cursor, and then look up each
+# cursor's definition in it.
+#
+def countDefinitions(cursors, definitions, wrap):
+    counts = dict((wrap(cursor), 0) for cursor in cursors)
+    for definition in definitions:
+        key = wrap(definition)
+        if key in counts:
+            counts[key] += 1
+    return counts
+
+# And what add-trivial-switch-defaults used to do with the locations of
+# warnings: put them in a set, and then look up each cursor's location.
+#
+def findLocations(locations, wrap):
+    found = set(wrap(location) for location in locations)
+    return sum(1 for location in locations if wrap(location) in found)
+
+def unwrapped(x):
+    return x
+
+# Using cursors and locations as keys by wrapping them (the old way) and as
+# they are, now that they hash natively and keep their hashes.
+#
+@benchmark('hashing')
+def hashingBenchmark(args, printf):
+    transUnit = parse(args)
+    collector = RawCursorCollector()
+    traverse(transUnit.cursor, collector, FileFilter())
+    cursors = collector.cursors
+    definitions = [d for d in (c.get_definition() for c in cursors) if d is not None]
+    locations = [c.location for c in cursors]
+
+    note = '{} cursors, {} definitions'.format(len(cursors), len(definitions))
+    for label, wrap in [('cursor dict, HashableCursor keys', HashableCursor),
+                        ('cursor dict, Cursor keys', unwrapped)]:
+        seconds, _ = bestOf(args.repeat, countDefinitions, cursors, definitions, wrap)
+        report(printf, label, seconds, note)
+
+    note = '{} locations'.format(len(locations))
+    for label, wrap in [('location set, HashableLocation keys', HashableLocation),
+                        ('location set, SourceLocation keys', unwrapped)]:
+        seconds, _ = bestOf(args.repeat, findLocations, locations, wrap)
+        report(printf, label, seconds, note)
+
+# Counts the calls into libclang made within a 'with' block. Every libclang
+# function is an attribute of conf.lib (see clang.cindex.functionList), and
+# the bindings look it up there on each call, so each is swapped for one
+# that counts, and swapped back afterwards.
+#
+class FFICounter(object):
+    def __init__(self):
+        self.calls = Counter() # function name --> number of calls
+        self._originals = {}
+
+    def __enter__(self):
+        lib = conf.lib
+        for item in functionList:
+            original = getattr(lib, item[0], None)
+            if original is not None:
+                self._originals[item[0]] = original
+                setattr(lib, item[0], self._counting(item[0], original))
+        return self
+
+    def __exit__(self, *exception):
+        lib = conf.lib
+        for name, original in self._originals.iteritems():
+            setattr(lib, name, original)
+        self._originals = {}
+        return False
+
+    def _counting(self, name, function):
+        calls = self.calls
+        def counted(*args):
+            calls[name] += 1
+            return function(*args)
+        return counted
+
+    def total(self):
+        return sum(self.calls.itervalues())
+
+# What the fixers keep asking of each cursor: which file it's in (for
+# whitelists and filters), the offsets of its extent (for tokens), and what
+# it refers to. Each of 'reads' observers asks once, either of the libclang
+# cursor underneath or of the clangwrapper.CachedCursor that observer.traverse
+# hands out.
+#
+class AttributeReader(Observer):
+    def __init__(self, reads, raw):
+        super(AttributeReader, self).__init__()
+        self.reads = reads
+        self.raw = raw
+
+    def observe(self, cursor):
+        if self.raw:
+            cursor = cursor.cursor
+            for _ in xrange(self.reads):
+                file = cursor.location.file
+                fileName = None if file is None else file.name
+                extent = cursor.extent
+                offsets = extent.start.offset, extent.end.offset
+                definition = cursor.get_definition()
+        else:
+            for _ in xrange(self.reads):
+                fileName = cursor.fileName
+                offsets = cursor.startOffset, cursor.endOffset
+                definition = cursor.get_definition()
+
+def readAttributes(transUnit, reads, raw):
+    traverse(transUnit.cursor, AttributeReader(reads, raw), FileFilter())
+
+def runAllFixers(transUnit):
+    fixerArgs = argparse.Namespace(verbose=None, fromDiagnostics=None,
+                                   headers=None, noTodo=None)
+    return fixer.runPasses(transUnit,
+                           [module.getPass(transUnit, fixerArgs) \
+                            for module in fixer.loadFixers(fixer.fixerNames)])
+
+# Calls into libclang: reading the cursors' attributes from libclang every
+# time (the old way) versus once per cursor (clangwrapper.CachedCursor), and
+# what running all of the fixers over the file costs. The timings are
+# without counting, which slows every call down.
+#
+@benchmark('ffi')
+def ffiBenchmark(args, printf):
+    transUnit = parse(args)
+    reads = 3
+    for label, extra in [
+            ('traversal alone', (0, False)),
+            ('{} reads per cursor, libclang cursors'.format(reads), (reads, True)),
+            ('{} reads per cursor, CachedCursor'.format(reads), (reads, False))]:
+        seconds, _ = bestOf(args.repeat, readAttributes, transUnit, *extra)
+        with FFICounter() as counter:
+            readAttributes(transUnit, *extra)
+        report(printf, label, seconds, '{} libclang calls'.format(counter.total()))
+
+    seconds, _ = bestOf(args.repeat, runAllFixers, transUnit)
+    with FFICounter() as counter:
+        runAllFixers(transUnit)
+    report(printf, 'all of the fixers', seconds,
+           '{} libclang calls'.format(counter.total()))
+    for name, calls in counter.calls.most_common(5):
+        printf('    {:<41}{:>10}', name, calls)
+
+# A file of about 'size' bytes of source-looking lines, and 'count' rewrites
+# of it spread evenly over it, in no particular order.
+#
+def generateRewrites(size, count):
+    line = '    int variable{:08d} = {:08d};\n'
+    lineCount = size // len(line.format(0, 0))
+    text = ''.join(line.format(i, i) for i in xrange(lineCount))
+    stride = len(text) // count
+    rewrites = [(i * stride, 4, 'long') for i in xrange(count)]
+    random.Random(0).shuffle(rewrites)
+    return text, rewrites
+
+# The old way of applying rewrites: a seek and a read (and two writes) per
+# rewrite.
+#
+def rewriteBySeeking(fin, fout, rewrites):
+    rewrites = sorted(rewrites, key=lambda tup: tup[0])
+    fin.seek(0)
+    FROM_CURRENT_POSITION = 1
+    for offset, oldLen, replacement in rewrites:
+        fout.write(fin.read(offset - fin.tell())) # catch up
+        fout.write(replacement)
+        fin.seek(oldLen, FROM_CURRENT_POSITION) # skip the old
+    fout.write(fin.read()) # the rest of it
+
+def rewriteFile(function, inPath, outPath, rewrites):
+    with open(inPath, 'rb') as fin:
+        with open(outPath, 'wb') as fout:
+            function(fin, fout, rewrites)
+
+@benchmark('rewrite', needsFile=False)
+def rewriteBenchmark(args, printf):
+    text, rewrites = generateRewrites(5 * 1024 * 1024, 100000)
+    inPath = writeTempSource(text)
+    outPath = inPath + '.rewrite'
+    try:
+        note = '{:.1f} MB, {} rewrites'.format(len(text) / (1024.0 * 1024), len(rewrites))
+        seconds, _ = bestOf(args.repeat, rewriteFile,
+                            rewriteBySeeking, inPath, outPath, rewrites)
+        report(printf, 'rewrite by seeking', seconds, note)
+        with open(outPath, 'rb') as file:
+            expected = file.read()
+
+        seconds, _ = bestOf(args.repeat, rewriteFile,
+                            rewrite.rewrite, inPath, outPath, rewrites)
+        report(printf, 'rewrite.rewrite', seconds, note)
+        with open(outPath, 'rb') as file:
+            if file.read() != expected:
+                printf('WARNING The two disagree about the rewritten file.')
+    finally:
+        os.remove(inPath)
+        if os.path.exists(outPath):
+            os.remove(outPath)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the slow parts of the fixers.')
+    parser.add_argument('benchmark', choices=list(benchmarks) + ['all'],
+                        help='Which benchmark to run.')
+    parser.add_argument('file', type=str, nargs='?',
+                        help='The source file to parse, for benchmarks that need one.')
+    parser.add_argument('--flags-file', dest='flagsFile', action='store',
+                        help='Path to a file containing clang compiler flags separated by newlines.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Run each timing this many times and keep the fastest.')
+    parser.add_argument('--size', type=int, default=500,
+                        help='How big to make the input of benchmarks that generate their own.')
+    args = parser.parse_args()
+
+    names = list(benchmarks) if args.benchmark == 'all' else [args.benchmark]
+    for name in names:
+        function, needsFile = benchmarks[name]
+        if needsFile and args.file is None:
+            parser.error('The {} benchmark needs a file to parse.'.format(name))
+        printf('---- {} ----', name)
+        function(args, printf)
@@ -0,0 +1,73 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Which translation units a change touches. git says which files changed
+# in a revision range, and a reverse include graph (header --> translation
+# units that include it, directly or not) says which translation units
+# those files are part of.
+#
+
+import os
+import subprocess
+from collections import defaultdict
+
+# The absolute paths of the files that changed in 'revisions', which is
+# anything 'git diff' takes: "master..topic", "HEAD~3", etc. (a single
+# revision means "between there and the working tree"). 'directory' is
+# anywhere inside of the repository.
+#
+def changedFiles(revisions, directory='.'):
+    top = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'],
+                                  cwd=directory).strip()
+    names = subprocess.check_output(['git', 'diff', '--name-only', '-z', revisions],
+                                    cwd=top)
+    return set(os.path.normpath(os.path.join(top, name)) \
+               for name in names.split('\0') if name)
+
+# Which translation units include which files. 'sourcesByUnit' is a dict of
+# translation unit key (see incremental.unitKey) --> the absolute paths of
+# its main file and of everything it includes.
+#
+class ReverseIncludeGraph(object):
+    def __init__(self, sourcesByUnit):
+        self.units = set(sourcesByUnit)
+        self.includers = defaultdict(set) # file --> keys of translation units
+        for unit, sources in sourcesByUnit.iteritems():
+            for source in sources:
+                self.includers[os.path.realpath(source)].add(unit)
+
+    # The translation units that any of 'files' are a part of.
+    #
+    def unitsAffectedBy(self, files):
+        affected = set()
+        for path in files:
+            affected.update(self.includers.get(os.path.realpath(path), ()))
+        return affected
+
+# Of 'jobs' (see batch.getJobs), the ones that 'changed' (a set of absolute
+# paths) could affect: those whose translation unit includes a changed file,
+# those whose main file changed, and those 'graph' knows nothing about
+# (since they could include anything).
+#
+def affectedJobs(jobs, changed, graph, keyOf):
+    affected = graph.unitsAffectedBy(changed)
+    changed = set(os.path.realpath(path) for path in changed)
+    return [job for job in jobs \
+            if keyOf(job) in affected \
+               or keyOf(job) not in graph.units \
+               or os.path.realpath(keyOf(job)) in changed]
@@ -163,6 +163,7 @@ class SourceLocation(Structure):
     """
     _fields_ = [("ptr_data", c_void_p * 2), ("int_data", c_uint)]
     _data = None
+    _hash = None
 
     def _get_instantiation(self):
         if self._data is None:
@@ -214,9 +215,22 @@ class SourceLocation(Structure):
         """Get the file offset represented by this source location."""
         return self._get_instantiation()[3]
 
+    @property
+    def is_in_system_header(self):
+        """Returns true if the given source location is in a system header."""
+        return conf.lib.clang_Location_isInSystemHeader(self)
+
     def __eq__(self, other):
         return conf.lib.clang_equalLocations(self, other)
 
+    def __hash__(self):
+        """Hash of the file and the offset, which equal locations share."""
+        if self._hash is None:
+            f, _, _, offset = self._get_instantiation()
+            fileId = None if f is None else cast(f.obj, c_void_p).value
+            self._hash = hash((fileId, offset))
+        return self._hash
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
@@ -1152,6 +1166,9 @@ class Cursor(Structure):
     def __eq__(self, other):
         return conf.lib.clang_equalCursors(self, other)
 
+    def __hash__(self):
+        return self.hash
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
@@ -2966,6 +2983,11 @@ functionList = [
    Type,
    Type.from_result),
 
+  ("clang_getClangVersion",
+   [],
+   _CXString,
+   _CXString.from_result),
+
   ("clang_getCompletionAvailability",
    [c_void_p],
    c_int),
@@ -3354,6 +3376,10 @@ functionList = [
    [Type],
    bool),
 
+  ("clang_Location_isInSystemHeader",
+   [SourceLocation],
+   bool),
+
   ("clang_parseTranslationUnit",
    [Index, c_char_p, c_void_p, c_int, c_void_p, c_int, c_int],
    c_object_p),
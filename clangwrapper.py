@@ -18,14 +18,151 @@
 
 import clang
 from clang.cindex import *
+from ctypes import c_void_p, cast
 
 # Put the directory of your libclang.so here:
 #
 Config.set_library_path('/opt/bb/lib64') 
 
-# clang.cindex.Cursor has a hash property (a wrapper around a clang hash)
-# but it's not used to define a .__hash__ method, so I have to wrap
-# up the whole Cursor just to be able to use it as a dict key.
+# A libclang cursor that remembers the answers to what observers keep asking
+# of it: its kind, the offsets of its extent, the name of its file, its
+# definition, and its parents. Only the first asking goes to libclang. The
+# cursors it hands back (definition, parents, children) are CachedCursors
+# too, and anything else is passed through to the underlying cursor.
+# observer.traverse hands these to observers, and snapshot.SnapshotCursor
+# answers to the same names.
+#
+# A file's name is fetched from libclang once per translation unit and
+# interned, so every cursor in that file shares the one string.
+#
+_unknown = object()
+
+class CachedCursor(object):
+    __slots__ = ('cursor', '_kind', '_offsets', '_fileName', '_definition',
+                 '_semanticParent', '_lexicalParent')
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._kind = None
+        self._offsets = None
+        self._fileName = _unknown
+        self._definition = _unknown
+        self._semanticParent = _unknown
+        self._lexicalParent = _unknown
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    # ctypes passes this to libclang functions wherever a cursor is wanted.
+    #
+    @property
+    def _as_parameter_(self):
+        return self.cursor
+
+    @property
+    def _kind_id(self):
+        return self.cursor._kind_id
+
+    @property
+    def kind(self):
+        if self._kind is None:
+            self._kind = CursorKind.from_id(self.cursor._kind_id)
+        return self._kind
+
+    def _extentOffsets(self):
+        if self._offsets is None:
+            extent = self.cursor.extent
+            self._offsets = (extent.start.offset, extent.end.offset)
+        return self._offsets
+
+    @property
+    def startOffset(self):
+        return self._extentOffsets()[0]
+
+    @property
+    def endOffset(self):
+        return self._extentOffsets()[1]
+
+    # The name of the file the cursor's location is in, or None.
+    #
+    @property
+    def fileName(self):
+        if self._fileName is _unknown:
+            self._fileName = internedFileName(getattr(self.cursor, '_tu', None),
+                                              self.cursor.location.file)
+        return self._fileName
+
+    def get_definition(self):
+        if self._definition is _unknown:
+            self._definition = cached(self.cursor.get_definition())
+        return self._definition
+
+    @property
+    def semantic_parent(self):
+        if self._semanticParent is _unknown:
+            self._semanticParent = cached(self.cursor.semantic_parent)
+        return self._semanticParent
+
+    @property
+    def lexical_parent(self):
+        if self._lexicalParent is _unknown:
+            self._lexicalParent = cached(self.cursor.lexical_parent)
+        return self._lexicalParent
+
+    def get_children(self):
+        for child in self.cursor.get_children():
+            yield CachedCursor(child)
+
+    def __hash__(self):
+        return self.cursor.hash
+
+    def __eq__(self, other):
+        other = getattr(other, 'cursor', other) # a CachedCursor
+        return isinstance(other, Cursor) and self.cursor == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.cursor)
+
+# 'cursor' as a CachedCursor, if it's a libclang cursor. Anything else (None,
+# a CachedCursor already, a snapshot.SnapshotCursor) is left alone.
+#
+def cached(cursor):
+    return CachedCursor(cursor) if type(cursor) is Cursor else cursor
+
+# The name of 'file' (a clang.cindex.File, or None), interned per
+# translation unit by libclang's file handle. The handles are only good until
+# the translation unit is reparsed, so reparse with reparse() below.
+#
+def internedFileName(transUnit, file):
+    if file is None:
+        return None
+    if transUnit is None:
+        return file.name
+    names = transUnit.__dict__.get('_fileNames')
+    if names is None:
+        names = transUnit._fileNames = {}
+    handle = cast(file.obj, c_void_p).value
+    name = names.get(handle)
+    if name is None:
+        name = names[handle] = intern(file.name)
+    return name
+
+# transUnit.reparse(), forgetting the file names interned for it, since
+# libclang can free the old files and hand their addresses out again.
+#
+def reparse(transUnit):
+    transUnit.__dict__.pop('_fileNames', None)
+    transUnit.reparse()
+
+# clang.cindex.Cursor used to have a hash property (a wrapper around a clang
+# hash) but no .__hash__ method, so I had to wrap up the whole Cursor just to
+# be able to use it as a dict key. The same went for SourceLocation. Both
+# are hashable now (their hashes are computed once and kept), so cursors and
+# locations can be used as keys as they are. These are only kept around for
+# comparison; see benchmark.py.
 #
 class HashableCursor(object):
     def __init__(self, cursor):
@@ -52,9 +189,6 @@ class HashableCursor(object):
     def __ne__(self, other):
         return not self == other
 
-# TODO Would plain delegation ("inheritance") work for here and HashableCursor,
-#      or is the explicit forwarding of behavior necessary?
-#
 class HashableLocation(object):
     def __init__(self, location):
         self.location = location
@@ -0,0 +1,106 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# A file holding some named arrays ("columns") and a little JSON to go with
+# them. The format is:
+#
+#     magic        8 bytes saying what kind of file this is
+#     length       of the header, as a little-endian 64 bit integer
+#     header       JSON: whatever the caller wants to keep, plus the byte
+#                  order and the name, type code, and length of each column
+#     padding      up to a multiple of 8 bytes
+#     columns      each one's raw machine representation, in the header's
+#                  order, each padded up to a multiple of 8 bytes
+#
+# so a column is a fixed-width run of bytes at a known offset, and loading
+# the file is one mmap and one copy per column.
+#
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+_alignment = 8
+
+class ColumnFileError(Exception):
+    pass
+
+def _padding(n):
+    return (-n) % _alignment
+
+# 'columns' is a list of (name, array). 'header' is a dict. The file is
+# written under another name and then renamed, so that a reader never sees
+# half of one.
+#
+def save(path, magic, header, columns):
+    assert len(magic) == 8
+    header = dict(header)
+    header['byteorder'] = sys.byteorder
+    header['columns'] = [[name, column.typecode, len(column)] \
+                         for name, column in columns]
+    header = json.dumps(header)
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'wb') as out:
+        out.write(magic)
+        out.write(struct.pack('<Q', len(header)))
+        out.write(header)
+        out.write('\0' * _padding(len(magic) + 8 + len(header)))
+        for _, column in columns:
+            data = column.tostring()
+            out.write(data)
+            out.write('\0' * _padding(len(data)))
+    os.rename(temp, path)
+
+# Returns (header, dict of name --> array).
+#
+def load(path, magic):
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mapped) < len(magic) + 8 or mapped[:len(magic)] != magic:
+            raise ColumnFileError('{} is not a {} file'.format(path, magic))
+        position = len(magic)
+        headerLength, = struct.unpack('<Q', mapped[position:position + 8])
+        position += 8
+        header = json.loads(mapped[position:position + headerLength])
+        position += headerLength
+        position += _padding(position)
+
+        if header['byteorder'] != sys.byteorder:
+            raise ColumnFileError('{} was written on a {} endian machine'
+                                  .format(path, header['byteorder']))
+
+        columns = {}
+        for name, typecode, length in header['columns']:
+            column = array(str(typecode))
+            size = length * column.itemsize
+            column.fromstring(mapped[position:position + size])
+            columns[str(name)] = column
+            position += size + _padding(size)
+    finally:
+        mapped.close()
+
+    return header, columns
+
+# JSON gives us unicode, but everything else deals in str.
+#
+def asStr(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
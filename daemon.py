@@ -0,0 +1,220 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# A long-running process that keeps libclang loaded, and keeps an Index and
+# recently used TranslationUnits around, so that asking it to fix, print, or
+# show a file costs a reparse (or nothing, if the file hasn't changed)
+# rather than an interpreter start, a libclang load, and a full parse.
+#
+# The protocol, over a Unix domain socket, is one line of JSON each way per
+# connection. A request looks like:
+#
+#     {"command": "fix" | "print" | "show",
+#      "file": "foo.cpp",
+#      "cwd": "/where/the/client/is",
+#      "flags": ["-Ifoo", ...],
+#      "fixers": ["fix-init-order", ...],  # "fix" only; default is all
+#      "noTodo": false,                    # "fix" only
+#      "inPlace": false,                   # "fix" only
+#      "diff": false,                      # "fix" only; output is a patch
+#      "headers": false,                   # "fix" only
+#      "ignoreErrors": false}
+#
+# and a response looks like:
+#
+#     {"ok": true | false,
+#      "output": "...",       # what the script would have printed to stdout
+#      "diagnostics": "...",  # what the script would have printed to stderr
+#      "seconds": 0.01}
+#
+
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+import SocketServer
+from collections import OrderedDict
+from StringIO import StringIO
+
+import fileprinter
+import fixer
+from astcache import sourcesOf
+from clangwrapper import Index, TranslationUnit, reparse
+from observer import traverse, TreePrinter, FileFilter
+from rewrite import writeRewrites
+
+commands = ['fix', 'print', 'show']
+
+def defaultSocketPath():
+    return os.path.join(tempfile.gettempdir(),
+                        'fix-cpp-warnings-{}.sock'.format(os.getuid()))
+
+# JSON gives us unicode, but the clang bindings want str.
+#
+def _str(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+# The translation units the daemon is holding onto, least recently used
+# first. Each is parsed with a precompiled preamble, so that when one of its
+# files changes, reparsing it is cheap.
+#
+class TranslationUnitCache(object):
+    def __init__(self, maxCount):
+        self.maxCount = maxCount
+        self.index = Index.create()
+        self._entries = OrderedDict() # key --> (transUnit, modification times)
+
+    def get(self, filepath, flags):
+        key = (os.getcwd(), filepath, tuple(flags))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            transUnit = fixer.getTranslationUnit(
+                            filepath,
+                            fixer.hardcodedFlags + flags,
+                            self.index,
+                            options=TranslationUnit.PARSE_PRECOMPILED_PREAMBLE)
+        else:
+            transUnit, times = entry
+            if fixer.modificationTimes(times.keys()) != times:
+                reparse(transUnit)
+
+        times = fixer.modificationTimes(sourcesOf(filepath, transUnit))
+        self._entries[key] = (transUnit, times)
+        while len(self._entries) > self.maxCount:
+            self._entries.popitem(last=False)
+        return transUnit
+
+def _doNothing(*args, **kwargs):
+    pass
+
+# The fixer scripts read their options off of an argparse namespace.
+#
+def _fixerArgs(request):
+    return argparse.Namespace(verbose=None,
+                              noTodo=request.get('noTodo'),
+                              headers=request.get('headers'),
+                              ignoreErrors=request.get('ignoreErrors'),
+                              fromDiagnostics=None)
+
+def _fix(request, transUnit, printf, out):
+    args = _fixerArgs(request)
+    modules = fixer.loadFixers(request.get('fixers') or fixer.fixerNames)
+    rewritesByFile = fixer.runPasses(transUnit,
+                                     [module.getPass(transUnit, args) \
+                                      for module in modules])
+    filenames = None if request.get('headers') else [request['file']]
+    if request.get('diff'):
+        writeRewrites(rewritesByFile, filenames, _doNothing, diffFile=out)
+        return
+    written = writeRewrites(rewritesByFile, filenames, _doNothing,
+                            inPlace=request.get('inPlace'))
+    for filename in written:
+        printf('Rewrote {} ({} rewrites)', filename, len(rewritesByFile[filename]))
+
+def _print(request, transUnit, out):
+    onlyThisFile = set([request['file']])
+    traverse(transUnit.cursor,
+             TreePrinter(outFile=out, whitelist=onlyThisFile),
+             FileFilter(onlyThisFile))
+
+# Handle one request (a dict), returning the response (also a dict).
+#
+def handle(request, cache):
+    start = time.time()
+    out = StringIO()
+    err = StringIO()
+    printf = fileprinter.FilePrinter(out)
+    printerr = fileprinter.FilePrinter(err)
+    ok = True
+
+    try:
+        command = request['command']
+        if command not in commands:
+            raise ValueError('Unknown command {!r}'.format(command))
+        request['file'] = _str(request['file'])
+        os.chdir(_str(request['cwd']))
+
+        transUnit = cache.get(request['file'],
+                              [_str(flag) for flag in request.get('flags', [])])
+        didFindError = fixer.printErrors(transUnit, printerr)
+
+        if command == 'show':
+            pass # The diagnostics are all there is to show.
+        elif didFindError and not request.get('ignoreErrors'):
+            printerr('FATAL One or more errors found in compilation unit.')
+            ok = False
+        elif command == 'fix':
+            _fix(request, transUnit, printf, out)
+        elif command == 'print':
+            _print(request, transUnit, out)
+    except Exception as error:
+        printerr('{}: {}', type(error).__name__, error)
+        ok = False
+
+    return {'ok': ok,
+            'output': out.getvalue(),
+            'diagnostics': err.getvalue(),
+            'seconds': time.time() - start}
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError as error:
+            response = {'ok': False, 'output': '', 'seconds': 0,
+                        'diagnostics': 'Malformed request: {}\n'.format(error)}
+        else:
+            response = handle(request, self.server.cache)
+            if self.server.verbose:
+                fileprinter.printf('{} {} ({:.3f} seconds)',
+                                   request.get('command'),
+                                   request.get('file'),
+                                   response['seconds'])
+        self.wfile.write(json.dumps(response) + '\n')
+
+# Requests are handled one at a time; libclang translation units aren't
+# safe to share between threads.
+#
+class Server(SocketServer.UnixStreamServer):
+    def __init__(self, socketPath, maxTranslationUnits=16, verbose=False):
+        if os.path.exists(socketPath):
+            os.remove(socketPath) # left over from a previous daemon
+        SocketServer.UnixStreamServer.__init__(self, socketPath, _Handler)
+        self.cache = TranslationUnitCache(maxTranslationUnits)
+        self.verbose = verbose
+
+# Send a request to the daemon listening at socketPath, and return its
+# response.
+#
+def ask(socketPath, request):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socketPath)
+        connection.sendall(json.dumps(request) + '\n')
+        connection.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = connection.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        connection.close()
+    return json.loads(''.join(chunks))
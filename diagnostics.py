@@ -0,0 +1,150 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Collecting the warnings clang has about translation units, and nothing
+# else: no traversal, and no more parsing than the warnings asked for need
+# (see fixer.parseOptionsFor). Used by show-warnings.py to survey a file or
+# a whole compilation database before deciding which fixers to run.
+#
+
+import multiprocessing
+import os
+
+import fixer
+import incremental
+from clangwrapper import Diagnostic, Index, TranslationUnitLoadError
+
+# What has to be parsed for clang to diagnose each option. Any option not
+# in here gets the defaults.
+#
+_parseNeedsByOption = {
+    '-Wunused-parameter': set([fixer.FUNCTION_BODIES]),
+    # Constructors and switches in templates are diagnosed when they're
+    # instantiated.
+    '-Wreorder':          set([fixer.FUNCTION_BODIES, fixer.END_OF_UNIT]),
+    '-Wswitch':           set([fixer.FUNCTION_BODIES, fixer.END_OF_UNIT]),
+}
+
+_severities = {Diagnostic.Ignored: 'ignored',
+               Diagnostic.Note:    'note',
+               Diagnostic.Warning: 'warning',
+               Diagnostic.Error:   'error',
+               Diagnostic.Fatal:   'fatal'}
+
+# "reorder" and "-Wreorder" are both "-Wreorder".
+#
+def normalizeOption(option):
+    return option if option.startswith('-W') else '-W' + option
+
+# What has to be parsed to see the warnings for 'options' (None meaning all
+# of them).
+#
+def parseNeedsFor(options):
+    if not options:
+        return fixer.defaultParseNeeds
+    needs = set()
+    for option in options:
+        needs |= _parseNeedsByOption.get(option, fixer.defaultParseNeeds)
+    return needs
+
+# The flags that turn on the warnings for 'options', some of which (e.g.
+# -Wunused-parameter) aren't part of -Wall. They go after the translation
+# unit's own flags, so that they win over any -Wno-... in those.
+#
+def optionFlags(options):
+    return sorted(options or [])
+
+# A diagnostic as a dict, ready to be written out as JSON. 'key' is the
+# translation unit's (see incremental.unitKey).
+#
+def asDict(diag, key):
+    location = diag.location
+    return {'unit': key,
+            'file': location.file.name if location.file else None,
+            'line': location.line,
+            'column': location.column,
+            'offset': location.offset,
+            'severity': _severities.get(diag.severity, diag.severity),
+            'option': diag.option,
+            'message': diag.spelling}
+
+# The diagnostics of 'transUnit' as dicts (see asDict), limited to 'options'
+# if there are any. Errors are always included, since they could explain
+# why a warning is missing.
+#
+def collect(transUnit, key, options=None):
+    for diag in transUnit.diagnostics:
+        if not options or diag.option in options or diag.severity >= Diagnostic.Error:
+            yield asDict(diag, key)
+
+# Parsing the translation units of a compilation database is done across a
+# pool of workers the same way as in batch.py.
+#
+_index = None
+
+def _initWorker():
+    global _index
+    _index = Index.create()
+
+def collectJob(job, options):
+    directory, filepath, flags = job
+    key = incremental.unitKey(directory, filepath)
+    try:
+        os.chdir(directory)
+        transUnit = fixer.getTranslationUnit(filepath,
+                                             fixer.hardcodedFlags + flags + optionFlags(options),
+                                             _index,
+                                             options=fixer.parseOptionsFor(parseNeedsFor(options)))
+    except TranslationUnitLoadError as error:
+        return key, [], str(error)
+    return key, list(collect(transUnit, key, options)), None
+
+# Pool.imap wants a function of one argument.
+#
+def _collectJobWithOptions(jobAndOptions):
+    return collectJob(*jobAndOptions)
+
+# The diagnostics of each of 'jobs' (see batch.getJobs), as they're
+# collected: yields (key, list of dicts, error message or None). The same
+# warning in a header is reported by every translation unit that includes
+# it, so only the first of each is kept.
+#
+def collectJobs(jobs, options, processes):
+    work = [(job, options) for job in jobs]
+    if processes == 1:
+        _initWorker()
+        results = (_collectJobWithOptions(item) for item in work)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_initWorker)
+        results = pool.imap_unordered(_collectJobWithOptions, work)
+
+    seen = set()
+    try:
+        for key, diags, error in results:
+            fresh = []
+            for diag in diags:
+                identity = (diag['file'], diag['offset'], diag['option'], diag['message'])
+                if identity not in seen:
+                    seen.add(identity)
+                    fresh.append(diag)
+            yield key, fresh, error
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
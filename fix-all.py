@@ -0,0 +1,47 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+import fixer
+from fileprinter import printf
+
+def doNothing(*args, **kwargs):
+    pass
+
+if __name__ == '__main__':
+    util = fixer.Fixer('Run all of the fixers over a C++ file, parsing and '
+                       'traversing it only once.',
+                       lambda args: fixer.parseNeedsOf(
+                                        fixer.loadFixers(args.fixers or fixer.fixerNames),
+                                        args))
+    util.add_argument('--fixer', dest='fixers', action='append',
+                      choices=fixer.fixerNames,
+                      help='Run only this fixer. May be repeated. Default is all of them.')
+    util.add_argument('--no-todo', dest='noTodo', action='count',
+                      help="Don't add a TODO comment to each inserted 'default:'")
+    args, _ = util.setup()
+    modules = fixer.loadFixers(args.fixers or fixer.fixerNames)
+
+    def fix(args, transUnit):
+        rewritesByFile = fixer.runPasses(transUnit,
+                                         [module.getPass(transUnit, args) \
+                                          for module in modules])
+
+        util.writeRewrites(rewritesByFile, printf if args.verbose else doNothing)
+
+    util.run(fix)
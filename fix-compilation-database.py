@@ -0,0 +1,32 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+import batch
+import fixer
+import sys
+from fileprinter import printf, printerr
+
+if __name__ == '__main__':
+    util = batch.BatchFixer('Run the fixers over every translation unit in a '
+                            'compilation database (compile_commands.json).')
+    args, jobs = util.setup()
+
+    diffFile = fixer.getDiffFile(args)
+    summary = batch.run(jobs, args, args.jobs, diffFile=diffFile)
+    summary.report(printerr if diffFile is sys.stdout else printf)
@@ -17,10 +17,22 @@
 '''
 #!/usr/bin/python
 
-from clangwrapper import CursorKind, Cursor, HashableCursor
-from observer import traverse, Observer, ObserverGroup, printCursor
+from clangwrapper import CursorKind, Cursor
+from observer import traverse, Observer, ObserverGroup, FileFilter, printCursor
 from collections import defaultdict
+from tokenindex import tokensFor
+import fileprinter
 import fixer
+import seeds
+
+def doNothing(*args, **kwargs):
+    pass
+
+# Verbose output goes through printf, which findRewrites() points at stdout
+# only when asked to.
+#
+printf = doNothing
+printerr = fileprinter.printerr
 
 def isRecordDef(kind):
     return kind in (CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION,
@@ -29,50 +41,62 @@ def isRecordDef(kind):
                     CursorKind.CLASS_TEMPLATE,
                     CursorKind.STRUCT_DECL)
 
-def nameOrBlank(x):
-    return x.name if x else ''
-
-def notOnWhitelist(file, whitelist):
-    return len(whitelist) > 0 and nameOrBlank(file) not in whitelist
+def notOnWhitelist(fileName, whitelist):
+    return len(whitelist) > 0 and (fileName or '') not in whitelist
 
 from pprint import pprint
 
+# If given a registry.Registry, the FieldFinder tells it the field order of
+# each class outside of the main file, and asks it about fields of classes
+# that it hasn't seen itself (because the traversal skipped them).
+#
 class FieldFinder(Observer):
-    def __init__(self, whitelist):
+    def __init__(self, whitelist, registry=None, mainFile=None):
         super(FieldFinder, self).__init__()
         self._whitelist = whitelist
+        self._registry = registry
+        self._mainFile = mainFile
         self.classFields = defaultdict(list)
         self.classes = []
         self.fieldOrders = {} # Where each field is in its initializer list
 
     def observe(self, cursor):
-        if notOnWhitelist(cursor.location.file, self._whitelist):
+        if notOnWhitelist(cursor.fileName, self._whitelist):
             return
 
         if isRecordDef(cursor.kind):
-            self.classes.append(HashableCursor(cursor))
+            self.classes.append(cursor)
         elif cursor.kind == CursorKind.FIELD_DECL:
             fields = self.classFields[self.classes[-1]]
-            self.fieldOrders[HashableCursor(cursor)] = len(fields)
+            self.fieldOrders[cursor] = len(fields)
             fields.append(cursor)
 
     def popTo(self, cursor):
-        if notOnWhitelist(cursor.location.file, self._whitelist):
+        if notOnWhitelist(cursor.fileName, self._whitelist):
             return
 
         if isRecordDef(cursor.kind):
             assert self.classes[-1] == cursor
-            self.classes.pop()
+            record = self.classes.pop()
+            if self._registry is not None \
+               and cursor.fileName != self._mainFile:
+                self._registry.putFields(cursor, self.classFields[record])
+
+    def orderOf(self, field):
+        order = self.fieldOrders.get(field)
+        if order is None and self._registry is not None:
+            order = self._registry.fieldOrder(field)
+        return order
 
     def prettyPrint(self):
-        pprint([(record.displayname, [ (f.displayname, self.fieldOrders[HashableCursor(f)]) for f in fields ]) \
+        pprint([(record.displayname, [ (f.displayname, self.fieldOrders[f]) for f in fields ]) \
                 for record, fields in self.classFields.iteritems()])
 
 class InitMember:
     def __init__(self, cursor):
         self.cursor = cursor
-        self.filename = cursor.location.file.name
-        self.beginOffset = cursor.extent.start.offset
+        self.filename = cursor.fileName
+        self.beginOffset = cursor.startOffset
         self.endOffset = None # later
         self.text = None # later
 
@@ -87,26 +111,19 @@ class InitMember:
     def __ne__(self, other):
         return not self == other
 
-def extentIsBetween(test, begin, end):
-    isBetween = test.extent.start.offset >= begin.extent.start.offset \
-                and test.extent.start.offset <= end.extent.start.offset
-    if isBetween:
-        printf('"{}" is between offset {} and offset {}', 
-               test.spelling, 
-               begin.extent.start.offset,
-               end.extent.end.offset)
-
-    return isBetween
-
-def isCppStyleComment(token):
-    return token.kind.name == 'COMMENT' and token.spelling[:2] == '//'
+# 'tokens' is a tokenindex.TokenIndex, and 'i' is an index into it.
+#
+def isCppStyleComment(tokens, i):
+    return tokens.kinds[i].name == 'COMMENT' and tokens.spellings[i][:2] == '//'
 
 class InitFinder(Observer):
-    def __init__(self, whitelist):
+    def __init__(self, whitelist, tokens):
         super(InitFinder, self).__init__()
         self._whitelist = whitelist
+        self._tokens = tokens # tokenindex.TranslationUnitTokens
         self._currentConstructor = None
-        self._currentConstructorTokens = None
+        self._currentConstructorTokens = None # tokenindex.TokenIndex of its file
+        self._currentConstructorTokenRange = None # (begin, end) indices into that
         self.constructorFields = defaultdict(list)
         self._depthWithinConstructor = None # None if at or above. >= 1 if below.
         self._prevChildOfConstructor = None # Last seen immediate child.
@@ -131,47 +148,53 @@ class InitFinder(Observer):
         # member.
         assert prevChild != prevMember.cursor
 
-        tokensBetween = [tok for tok in self._currentConstructorTokens \
-                         if extentIsBetween(tok, prevMember.cursor, currentCursor)]
+        # The tokens between the previous member and now are those of the
+        # constructor's tokens that start within that range of offsets. They're
+        # sorted by offset, so that's a couple of binary searches.
+        tokens = self._currentConstructorTokens
+        constructorBegin, constructorEnd = self._currentConstructorTokenRange
+        begin, end = tokens.indicesStartingBetween(prevMember.beginOffset,
+                                                   currentCursor.startOffset)
+        begin, end = max(begin, constructorBegin), min(end, constructorEnd)
         # For the same reason as above, there must be tokens between now and
         # the previous member.
-        assert len(tokensBetween) > 0
+        assert end > begin
 
-        separatorsBetween = [tok for tok in tokensBetween \
-                             if tok.spelling in (',', '{')]
         # There has to be either a ',' or a '{' between the previous member
         # and now (inclusive -- important for the case where now is '{').
-        assert len(separatorsBetween) > 0
-        lastSeparator = separatorsBetween[-1]
+        lastSeparator = next((i for i in xrange(end - 1, begin - 1, -1) \
+                              if tokens.spellings[i] in (',', '{')), None)
+        assert lastSeparator is not None
 
         # We want to consume whitespace before lastSeparatorBegin,
         # but only if the previous token (if one exists) is not
         # a cppStyleComment.
         #
-        tokIndex = tokensBetween.index(lastSeparator)
-        if tokIndex != 0 and not isCppStyleComment(tokensBetween[tokIndex - 1]):
-            tokJustBefore = tokensBetween[tokIndex - 1]
+        if lastSeparator != begin and not isCppStyleComment(tokens, lastSeparator - 1):
             # Eat whitespace
             printf('For member "{}" I\'m backing up to the token "{}"', 
                    prevMember.cursor.spelling,
-                   tokJustBefore.spelling)
-            prevMember.endOffset = tokJustBefore.extent.end.offset
+                   tokens.spellings[lastSeparator - 1])
+            prevMember.endOffset = tokens.ends[lastSeparator - 1]
         else:
             # Don't eat whitespace
             printf('For member "{}" I\'m sticking with token "{}"', 
                    prevMember.cursor.spelling,
-                   lastSeparator.spelling)
-            prevMember.endOffset = lastSeparator.extent.start.offset
+                   tokens.spellings[lastSeparator])
+            prevMember.endOffset = tokens.starts[lastSeparator]
 
         self._prevMemberOfConstructor = None # Done with that guy
 
     def observe(self, cursor):
-        if notOnWhitelist(cursor.location.file, self._whitelist):
+        if notOnWhitelist(cursor.fileName, self._whitelist):
             return
 
         if cursor.kind == CursorKind.CONSTRUCTOR:
-            self._currentConstructor = HashableCursor(cursor)
-            self._currentConstructorTokens = list(cursor.get_tokens())
+            self._currentConstructor = cursor
+            self._currentConstructorTokens = self._tokens.indexOf(cursor.fileName)
+            self._currentConstructorTokenRange = \
+                self._currentConstructorTokens.indicesBetween(cursor.startOffset,
+                                                              cursor.endOffset)
         elif self._inConstructorChildren():
             if cursor.kind == CursorKind.MEMBER_REF:
                 self._updatePreviousMemberOfConstructor(cursor)
@@ -189,7 +212,7 @@ class InitFinder(Observer):
             elif cursor.kind in (CursorKind.COMPOUND_STMT, CursorKind.TYPE_REF, CursorKind.NAMESPACE_REF):
                 self._updatePreviousMemberOfConstructor(cursor)
             elif cursor.kind == CursorKind.UNEXPOSED_EXPR \
-             and cursor.extent.start == cursor.extent.end:
+             and cursor.startOffset == cursor.endOffset:
                 pass
                 # zero-extent unexposed expression (most likely "()"). Bug?
                 # printerr('Warning: This node could be crap')
@@ -197,7 +220,7 @@ class InitFinder(Observer):
             self._prevChildOfConstructor = cursor
 
     def popTo(self, cursor):
-        if notOnWhitelist(cursor.location.file, self._whitelist):
+        if notOnWhitelist(cursor.fileName, self._whitelist):
             return
 
         if cursor.kind == CursorKind.CONSTRUCTOR:
@@ -205,13 +228,14 @@ class InitFinder(Observer):
             self._depthWithinConstructor = None
             self._currentConstructor = None
             self._currentConstructorTokens = None
+            self._currentConstructorTokenRange = None
             self._prevChildOfConstructor = None
             self._prevMemberOfConstructor = None
         elif self._depthWithinConstructor is not None:
             self._depthWithinConstructor -= 1
 
     def pushFrom(self, cursor):
-        if notOnWhitelist(cursor.location.file, self._whitelist):
+        if notOnWhitelist(cursor.fileName, self._whitelist):
             return
 
         if cursor.kind == CursorKind.CONSTRUCTOR:
@@ -255,10 +279,9 @@ class MisorderedInitMember:
         self.wrong = wrong
         self.right = right
 
-def misorderedInitMembers(fields, inits):
-    orders = fields.fieldOrders
+def misorderedInitMembers(fields, inits, verbose=False):
     def lookupOrder(member):
-        order = orders.get(HashableCursor(member.cursor.get_definition()))
+        order = fields.orderOf(member.cursor.get_definition())
         if order is None:
             printerr('The following cursor:')
             printCursor(member.cursor, printerr)
@@ -274,14 +297,14 @@ def misorderedInitMembers(fields, inits):
         assert len(sortedCopy) == len(fields)
         for asInConstructor, asInDefinition in zip(fields, sortedCopy):
             if asInDefinition != asInConstructor:
-                if args.verbose:
+                if verbose:
                     printf('{} {} --> {}', 
                            constructor.displayname, 
                            asInConstructor.text,
                            asInDefinition.text)
                 yield MisorderedInitMember(asInConstructor, asInDefinition)
 
-def getRewrites(fields, inits):
+def getRewrites(fields, inits, verbose=False):
     # A single rewrite has the form:
     #    (beginOffset, originalLength, replacementText)
     # but here I prepend filename so we can group by it next.
@@ -289,7 +312,7 @@ def getRewrites(fields, inits):
     rewrites = [(x.wrong.filename,
                  x.wrong.beginOffset, 
                  len(x.wrong.text), 
-                 x.right.text) for x in misorderedInitMembers(fields, inits)]
+                 x.right.text) for x in misorderedInitMembers(fields, inits, verbose)]
     
     rewritesByFile = defaultdict(list)
     for rw in rewrites:
@@ -297,19 +320,42 @@ def getRewrites(fields, inits):
 
     return rewritesByFile
 
-def doNothing(*args, **kwargs):
-    pass
-
-if __name__ == '__main__':
-
-    util = fixer.Fixer('Rewrite misordered items in member initializer lists.')
-    args, transUnit = util.setup()
-    filepath = util.filepath
-    
-    import fileprinter
+# With --from-diagnostics, only the constructors clang warned about
+# (-Wreorder) are analyzed, along with their classes, and nothing else is
+# traversed. Returns a list of (record, constructor) cursors.
+#
+def warnedConstructors(transUnit, filenames):
+    found = {} # constructor --> (record, constructor)
+    for diag in seeds.diagnosticsFor(transUnit, '-Wreorder', filenames):
+        constructor = seeds.enclosingConstructor(transUnit, diag.location)
+        if constructor is None:
+            printerr('WARNING Found no constructor for this warning: {}', diag)
+            continue
+        found[constructor] = (constructor.semantic_parent, constructor)
+    return found.values()
+
+def _getSeededPass(transUnit, args, fields, inits, finish):
+    filenames = None if args.headers else set([transUnit.spelling])
+
+    def seededFinish():
+        records = set()
+        for record, constructor in warnedConstructors(transUnit, filenames):
+            if record not in records:
+                records.add(record)
+                traverse(record, fields)
+            traverse(constructor, inits)
+        return finish()
+
+    return fixer.Pass(Observer(), seededFinish, FileFilter([]))
+
+# The observers that find misordered member initializers, and a function
+# that turns what they found into rewrites once the traversal is done.
+# See fixer.Pass.
+#
+def getPass(transUnit, args, registry=None):
+    global printf
     printf = fileprinter.printf if args.verbose else doNothing
-    printerr = fileprinter.printerr
- 
+
     # import re
     # fileWhitelist = set([re.sub(r'\.cpp$', '.h', filepath),
     #                      re.sub(r'\.h$', '.cpp', filepath)])
@@ -317,33 +363,60 @@ if __name__ == '__main__':
     # Empty whitelist means "accept all the files"
     fileWhitelist = set()
 
-    fields = FieldFinder(fileWhitelist)
-    inits = InitFinder(fileWhitelist)
-    observers = ObserverGroup([fields, inits])
-
-    traverse(transUnit.cursor, observers)
-    inits.fillInitFieldsText()
-
-    if args.verbose:
-        printf('\n\nThe fields:')
-        fields.prettyPrint()
-        printf('\n\nThe constructors:')
-        inits.prettyPrint()
-        printf('')
-
-    rewritesPerFile = getRewrites(fields, inits)
-    printf('\nThe rewrites:')
-    printf(rewritesPerFile)
-
-    printf("Now let's try to do the rewrites")
-    from rewrite import rewrite
-    for filename, rewrites in rewritesPerFile.iteritems():
-        if filename != filepath:
-            printf('Skipping file {}', filename)
-            continue
-        elif len(rewrites) == 0:
-            continue
-        with open(filename, 'r') as fin:
-            with open(filename + '.rewrite', 'w') as fout:
-                rewrite(fin, fout, rewrites)
+    fields = FieldFinder(fileWhitelist, registry, transUnit.spelling)
+    inits = InitFinder(fileWhitelist, tokensFor(transUnit))
+
+    def finish():
+        inits.fillInitFieldsText()
+
+        if args.verbose:
+            printf('\n\nThe fields:')
+            fields.prettyPrint()
+            printf('\n\nThe constructors:')
+            inits.prettyPrint()
+            printf('')
+
+        rewritesPerFile = getRewrites(fields, inits, args.verbose)
+        printf('\nThe rewrites:')
+        printf(rewritesPerFile)
+
+        return rewritesPerFile
+
+    if args.fromDiagnostics:
+        return _getSeededPass(transUnit, args, fields, inits, finish)
+
+    # Class definitions can be in any header, but not in system headers,
+    # since we don't fix those.
+    return fixer.Pass(ObserverGroup([fields, inits]), finish, FileFilter())
+
+# The member initializers are parsed along with the constructor's body, so
+# function bodies are needed. The traversal doesn't need what clang does at
+# the end of the translation unit (see fixer.parseOptionsFor), but
+# --from-diagnostics does: clang doesn't check the order of initializers in
+# a class template until it instantiates the constructor, which is at the
+# end of the translation unit.
+#
+def parseNeeds(args):
+    if args.fromDiagnostics:
+        return set([fixer.FUNCTION_BODIES, fixer.END_OF_UNIT])
+    return set([fixer.FUNCTION_BODIES])
+
+# Find the misordered member initializers in a translation unit.
+# Returns a dict of filename --> list of rewrites.
+#
+def findRewrites(transUnit, args):
+    return fixer.runPasses(transUnit, [getPass(transUnit, args)])
+
+if __name__ == '__main__':
+
+    util = fixer.Fixer('Rewrite misordered items in member initializer lists.',
+                       parseNeeds)
+    util.setup()
+
+    def fix(args, transUnit):
+        rewritesPerFile = findRewrites(transUnit, args)
+
+        printf("Now let's try to do the rewrites")
+        util.writeRewrites(rewritesPerFile, printf)
 
+    util.run(fix)
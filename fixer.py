@@ -18,22 +18,36 @@
 
 import argparse
 import fileprinter
+from astcache import AstCache, sourcesOf
+import importlib
+import os
 import sys
-from clangwrapper import Index, Diagnostic
-from observer import traverse, TreePrinter
+import time
+from clangwrapper import Index, Diagnostic, TranslationUnit, reparse
+from observer import traverse, TreePrinter, ObserverGroup, FileFilter
+from collections import defaultdict, namedtuple
 import re
+import seeds
+import snapshot
+from registry import SeenFilter, SeenObserver
+from rewrite import writeRewrites, RewriteConflictError, describeConflict
 
 # Shared utilties for the initialization of warning fixer scripts:
 #    - Command line arguments (including reading compiler flags)
 #    - Printing the syntax tree
 #    - Detecting parsing errors
+#    - Running again whenever the file changes (--watch)
 #
 # Come to think of it, this doesn't really need to be an object.
 # I just like how the caller doesn't have to import argparse.
 #
+# 'parseNeeds' is what the script needs parsed (see parseOptionsFor): a set,
+# or a function of the parsed arguments that returns one.
+#
 class Fixer(object):
-    def __init__(self, description):
+    def __init__(self, description, parseNeeds=None):
         self._parser = argparse.ArgumentParser(description=description)
+        self._parseNeeds = defaultParseNeeds if parseNeeds is None else parseNeeds
         _addDefaultArgs(self._parser)
 
     def add_argument(self, *args, **kwargs):
@@ -43,25 +57,258 @@ class Fixer(object):
         self.args = self._parser.parse_args()
         self.filepath = self.args.file
         self.flags = _getFlagsFromArgs(self.args)
+        self.diffFile = getDiffFile(self.args)
+
+        if self.args.fromSnapshot:
+            return self._setupFromSnapshot()
+
+        # A translation unit loaded from the AST cache can't be reparsed,
+        # and a process that's sticking around has no need of the cache.
+        cache = None if self.args.watch else getAstCache(self.args)
+        needs = self._parseNeeds
+        if callable(needs):
+            needs = needs(self.args)
+        self.transUnit = getTranslationUnit(self.filepath,
+                                            getParseFlags(self.flags, self.args),
+                                            cache=cache,
+                                            options=getParseOptions(self.args, needs))
+
+        if not self._check() and not self.args.ignoreErrors:
+            sys.exit('FATAL One or more errors found in compilation unit.')
+
+        return self.args, self.transUnit
+
+    # With --from-snapshot, 'file' is a snapshot (see snapshot.py and
+    # snapshot-ast.py) to be analyzed in place of a translation unit. There's
+    # nothing to parse, and no syntax tree to print.
+    #
+    def _setupFromSnapshot(self):
+        if self.args.watch:
+            sys.exit('FATAL --watch makes no sense with --from-snapshot.')
+        self.transUnit = snapshot.load(self.filepath)
+        self.filepath = self.transUnit.spelling
+
+        didFindError = printErrors(self.transUnit, fileprinter.printerr)
+        if didFindError and not self.args.ignoreErrors:
+            sys.exit('FATAL One or more errors found in compilation unit.')
+
+        return self.args, self.transUnit
+
+    # Call function(args, transUnit). With --watch, keep going: each time the
+    # file or anything it includes changes, reparse and call it again.
+    #
+    def run(self, function):
+        function(self.args, self.transUnit)
+        try:
+            while self.args.watch:
+                _waitForChanges(sourcesOf(self.filepath, self.transUnit))
+                reparse(self.transUnit)
+                if self._check() or self.args.ignoreErrors:
+                    function(self.args, self.transUnit)
+                else:
+                    fileprinter.printerr('One or more errors found in compilation unit. '
+                                         'Waiting for another change.')
+        except KeyboardInterrupt:
+            pass
 
-        hardcodedFlags = ['-xc++', '-std=c++98', '-Wall']
-        self.transUnit = _getTranslationUnit(self.filepath, hardcodedFlags + self.flags)
+    # Write the rewrites the way the command line asked for: to which files
+    # (--headers) and how (--in-place, --diff). A file whose rewrites
+    # conflict (several fixers wanting the same code changed differently) is
+    # reported, with each of its conflicts, and left alone; the rest are
+    # still written.
+    #
+    def writeRewrites(self, rewritesByFile, printf):
+        filenames = None if self.args.headers else [self.filepath]
+        written = []
+        for filename in sorted(rewritesByFile):
+            try:
+                written += writeRewrites({filename: rewritesByFile[filename]},
+                                         filenames,
+                                         printf,
+                                         inPlace=self.args.inPlace,
+                                         diffFile=self.diffFile)
+            except RewriteConflictError as error:
+                fileprinter.printerr('FAILED {}: {} conflicting rewrites, left alone',
+                                     filename, len(error.conflicts))
+                for conflict in error.conflicts:
+                    fileprinter.printerr('    {}', describeConflict(conflict))
+        return written
 
+    # Print the tree (if verbose) and the diagnostics. Returns False if
+    # there were errors.
+    #
+    def _check(self):
         if self.args.verbose:
             traverse(self.transUnit.cursor, TreePrinter())
             fileprinter.printf('\n')
         
-        didFindError = _printErrors(self.transUnit, fileprinter.printerr)
-        if didFindError and not self.args.ignoreErrors:
-            sys.exit('FATAL One or more errors found in compilation unit.')
+        didFindError = printErrors(self.transUnit, fileprinter.printerr)
+        return not didFindError
 
-        return self.args, self.transUnit
+# Flags passed to clang ahead of any user-supplied flags. Later flags win, so
+# a compilation database or flags file can still override these.
+#
+hardcodedFlags = ['-xc++', '-std=c++98', '-Wall']
 
-def _getTranslationUnit(filepath, flags):
-    index = Index.create()
-    transUnit = index.parse(filepath, flags)
+# The flags to parse with: ours, then 'flags', then, with --from-diagnostics,
+# those for the warnings that the fixers start from (see seeds.py), last so
+# that nothing turns them off.
+#
+def getParseFlags(flags, args):
+    return hardcodedFlags + flags + (seeds.seedFlags if args.fromDiagnostics else [])
+
+# Pass an index if you're going to parse many files; creating one per
+# translation unit is wasteful. Pass an astcache.AstCache to load the
+# translation unit from there if it's up to date, and to save it there if not.
+#
+def getTranslationUnit(filepath, flags, index=None, cache=None, options=0):
+    if index is None:
+        index = Index.create()
+    if cache is not None:
+        transUnit = cache.get(filepath, flags, index, options)
+        if transUnit is not None:
+            return transUnit
+    transUnit = index.parse(filepath, flags, options=options)
+    if cache is not None:
+        cache.put(filepath, flags, transUnit, options)
     return transUnit
 
+# What a script can need parsed, beyond the declarations. A translation unit
+# is parsed with no more than the scripts using it need, since the bodies of
+# every inline function in every header are most of the work of parsing.
+#
+#     FUNCTION_BODIES  the bodies of functions, including constructors'
+#                      member initializers. Without it,
+#                      PARSE_SKIP_FUNCTION_BODIES.
+#     END_OF_UNIT      what clang does once it reaches the end of the
+#                      translation unit: instantiating templates, and the
+#                      diagnostics that come of that. Without it,
+#                      PARSE_INCOMPLETE.
+#     PREPROCESSING    macro definitions, macro expansions, and inclusion
+#                      directives, as cursors. With it,
+#                      PARSE_DETAILED_PROCESSING_RECORD.
+#
+FUNCTION_BODIES = 'function bodies'
+END_OF_UNIT = 'end of translation unit'
+PREPROCESSING = 'preprocessing record'
+
+# What's parsed for a script that doesn't say: everything but the
+# preprocessing record, which is what clang does by default.
+#
+defaultParseNeeds = frozenset([FUNCTION_BODIES, END_OF_UNIT])
+
+def parseOptionsFor(needs):
+    options = TranslationUnit.PARSE_NONE
+    if FUNCTION_BODIES not in needs:
+        options |= TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+    if END_OF_UNIT not in needs:
+        options |= TranslationUnit.PARSE_INCOMPLETE
+    if PREPROCESSING in needs:
+        options |= TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+    return options
+
+# What the fixer modules 'modules' need parsed, between them, when run with
+# the parsed arguments 'args'. A fixer module says what it needs with
+#
+#     parseNeeds = set([...])
+#
+# or, if that depends on the arguments, with a function of them that returns
+# such a set. One that doesn't say needs the defaults.
+#
+def parseNeedsOf(modules, args):
+    needs = set()
+    for module in modules:
+        moduleNeeds = getattr(module, 'parseNeeds', defaultParseNeeds)
+        if callable(moduleNeeds):
+            moduleNeeds = moduleNeeds(args)
+        needs |= moduleNeeds
+    return needs
+
+# The TranslationUnit.PARSE_* options for 'needs', plus those asked for on
+# the command line.
+#
+def getParseOptions(args, needs=defaultParseNeeds):
+    options = parseOptionsFor(needs)
+    if args.preamble:
+        options |= TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+    return options
+
+def modificationTimes(paths):
+    times = {}
+    for path in paths:
+        try:
+            times[path] = os.stat(path).st_mtime
+        except OSError:
+            times[path] = None # Deleted? That's a change too.
+    return times
+
+def _waitForChanges(paths, pollSeconds=0.5):
+    before = modificationTimes(paths)
+    while modificationTimes(paths) == before:
+        time.sleep(pollSeconds)
+
+# The AST cache asked for on the command line, if any.
+#
+def getAstCache(args):
+    if not args.astCache:
+        return None
+    return AstCache(args.astCache, args.astCacheSize * 1024 * 1024)
+
+# What a fixer needs done to a translation unit:
+#    - observer: what it needs traversed over the AST.
+#    - finish: called once the traversal is done, returns a dict of
+#      filename --> list of rewrites.
+#    - fileFilter: an observer.FileFilter limiting the traversal to the files
+#      the fixer cares about, or None if it needs to see everything.
+#
+Pass = namedtuple('Pass', ['observer', 'finish', 'fileFilter'])
+
+# The fixer scripts, by module name. Each of them defines
+#
+#     getPass(transUnit, args, registry=None) --> Pass
+#
+# where 'registry', if given, is the registry.Registry that runPasses will
+# be given too, and may define 'parseNeeds' (see parseNeedsOf).
+#
+fixerNames = ['fix-init-order',
+              'remove-unused-parameters',
+              'add-trivial-switch-defaults']
+
+def loadFixers(names=fixerNames):
+    return [importlib.import_module(name) for name in names]
+
+# Run several fixers' passes over a translation unit with a single traversal,
+# and merge their rewrites by file. The traversal covers every file that any
+# of the passes is interested in. If a registry.Registry is given, then
+# definitions in headers that it says were already analyzed (for another
+# translation unit) are skipped, and the ones analyzed now are added to it.
+# If 'wrapFilter' is given, it's handed the file filter that the traversal
+# would use, and returns the one it will use instead (see
+# includegraph.OwnerFilter).
+#
+def runPasses(transUnit, passes, registry=None, wrapFilter=None):
+    observers = [p.observer for p in passes]
+    fileFilter = FileFilter.union(p.fileFilter for p in passes)
+    if fileFilter is not None and fileFilter.isEmpty():
+        # Nobody wants anything traversed (see the passes that start from
+        # diagnostics), so don't.
+        return _finishPasses(passes)
+    if registry is not None:
+        observers.append(SeenObserver(registry, transUnit.spelling))
+        fileFilter = SeenFilter(fileFilter, registry, transUnit.spelling)
+    if wrapFilter is not None:
+        fileFilter = wrapFilter(fileFilter)
+
+    traverse(transUnit.cursor, ObserverGroup(observers), fileFilter)
+    return _finishPasses(passes)
+
+def _finishPasses(passes):
+    rewritesByFile = defaultdict(list)
+    for p in passes:
+        for filename, rewrites in p.finish().iteritems():
+            rewritesByFile[filename].extend(rewrites)
+    return rewritesByFile
+
 def _addDefaultArgs(parser):
     parser.add_argument('file', type=str,
                         help='The source file to analyze and rewrite.')
@@ -71,8 +318,56 @@ def _addDefaultArgs(parser):
                         help='Log to stdout verbosely.')
     parser.add_argument('--ignore-errors', dest='ignoreErrors', action='count',
                         help="Don't quit after encountering a compiler error.")
+    parser.add_argument('--preamble', action='count',
+                        help='Precompile the preamble (the #includes at the top of '
+                             'the file), so that reparsing after a change only has '
+                             'to deal with the main file. Most useful with --watch.')
+    parser.add_argument('--watch', action='count',
+                        help='Keep running: whenever the file or anything it includes '
+                             'changes, reparse it and run again.')
+    addSeedArgs(parser)
+    parser.add_argument('--from-snapshot', dest='fromSnapshot', action='count',
+                        help="The file is a snapshot written by snapshot-ast.py. "
+                             "Analyze that instead of parsing anything.")
+    addAstCacheArgs(parser)
+    addRewriteArgs(parser)
+
+def addSeedArgs(parser):
+    parser.add_argument('--from-diagnostics', dest='fromDiagnostics', action='count',
+                        help="Only analyze what clang warned about (-Wreorder, "
+                             "-Wunused-parameter), found by way of the warnings' "
+                             "locations, instead of traversing everything.")
+
+def addAstCacheArgs(parser):
+    parser.add_argument('--ast-cache', dest='astCache', action='store',
+                        help='Directory in which to cache parsed translation units '
+                             'between runs.')
+    parser.add_argument('--ast-cache-size', dest='astCacheSize', type=int, default=1024,
+                        help='Maximum size of the AST cache, in megabytes. Least '
+                             'recently used entries are evicted first.')
+
+def addRewriteArgs(parser):
+    parser.add_argument('--in-place', dest='inPlace', action='count',
+                        help='Overwrite the file itself (atomically) instead of writing '
+                             '<file>.rewrite next to it.')
+    parser.add_argument('--diff', dest='diff', action='store', metavar='PATCH',
+                        help="Don't rewrite anything; write a unified diff of the "
+                             "rewrites to PATCH instead (- for stdout), suitable for "
+                             "git apply.")
+    parser.add_argument('--headers', dest='headers', action='count',
+                        help='Rewrite the (non-system) headers that the file includes, '
+                             'not just the file itself.')
+
+# The file that --diff asked for, opened, or None.
+#
+def getDiffFile(args):
+    if not args.diff:
+        return None
+    elif args.diff == '-':
+        return sys.stdout
+    return open(args.diff, 'w')
 
-def _getFlagsFromFile(name):
+def getFlagsFromFile(name):
     with open(name, 'r') as file:
         uncommented = [ line.strip() for line in file.readlines() if not re.match(r'^\s*#', line)]
         unblank = [ line for line in uncommented if len(line) > 0 ]
@@ -80,11 +375,11 @@ def _getFlagsFromFile(name):
 
 def _getFlagsFromArgs(args):
     if args.flagsFile:
-        return _getFlagsFromFile(args.flagsFile)
+        return getFlagsFromFile(args.flagsFile)
     else:
         return []
 
-def _printErrors(transUnit, printerr):
+def printErrors(transUnit, printerr):
     didFindError = False
     for diag in transUnit.diagnostics:
         if diag.severity >= Diagnostic.Error:
@@ -0,0 +1,327 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# An index of which translation units include which files, kept in a file
+# between runs (see index-includes.py, and --include-index in batch.py).
+#
+# Every path is given a file id, and the index is a handful of arrays:
+#
+#     unitFiles[u]       file id of translation unit u's key (its main file;
+#                        see incremental.unitKey)
+#     unitFlags[u]       crc32 of the flags u was parsed with
+#     unitStarts[u]      u's sources are sources[unitStarts[u]:unitStarts[u + 1]]
+#     sources[i]         file id of something u includes (or its main file)
+#     sourceTimes[i]     the modification time of that file when u was indexed
+#
+# The reverse graph (file --> the translation units that include it) is the
+# same thing turned inside out, and is built from those when it's first
+# asked for rather than saved.
+#
+# A translation unit's entry is stale if it's parsed with different flags
+# now, or if any of its sources has been modified (or deleted) since. Only
+# stale and new translation units need parsing to bring the index up to
+# date.
+#
+
+import multiprocessing
+import os
+import zlib
+from array import array
+
+import columnfile
+import fixer
+import incremental
+from astcache import sourcesOf
+from clangwrapper import CursorKind, Index, TranslationUnitLoadError
+from columnfile import asStr
+from registry import definitionKinds
+
+_magic = 'FCWINCL1'
+
+def flagsHash(flags):
+    return zlib.crc32('\0'.join(flags)) & 0x7fffffff
+
+def _modificationTime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return -1.0
+
+class IncludeGraph(object):
+    def __init__(self):
+        self.files = []      # file id --> path
+        self._ids = {}       # path --> file id
+        self._units = {}     # unit's file id --> (flags hash, sources, times)
+        self._includers = None # file id --> array of units' file ids
+
+    def fileId(self, path):
+        id = self._ids.get(path)
+        if id is None:
+            id = len(self.files)
+            self.files.append(path)
+            self._ids[path] = id
+        return id
+
+    @property
+    def units(self):
+        return set(self.files[id] for id in self._units)
+
+    # Record that the translation unit 'key', parsed with 'flags', consists
+    # of 'sources' (absolute paths).
+    #
+    def setUnit(self, key, flags, sources):
+        paths = sorted(set(os.path.realpath(source) for source in sources))
+        self._units[self.fileId(key)] = \
+            (flagsHash(flags),
+             array('i', (self.fileId(path) for path in paths)),
+             array('d', (_modificationTime(path) for path in paths)))
+        self._includers = None
+
+    def removeUnit(self, key):
+        id = self._ids.get(key)
+        if id is not None and self._units.pop(id, None) is not None:
+            self._includers = None
+
+    # Whether the entry for 'key' is missing or out of date. 'times' is a
+    # dict of path --> modification time, shared between calls so that
+    # each file is stat'd once.
+    #
+    def isStale(self, key, flags, times=None):
+        id = self._ids.get(key)
+        entry = None if id is None else self._units.get(id)
+        if entry is None:
+            return True
+        hash, sources, sourceTimes = entry
+        if hash != flagsHash(flags):
+            return True
+        if times is None:
+            times = {}
+        for source, then in zip(sources, sourceTimes):
+            path = self.files[source]
+            now = times.get(path)
+            if now is None:
+                now = times[path] = _modificationTime(path)
+            if now != then:
+                return True
+        return False
+
+    def _reverse(self):
+        if self._includers is None:
+            includers = {}
+            for unit, (_, sources, _) in self._units.iteritems():
+                for source in sources:
+                    includers.setdefault(source, array('i')).append(unit)
+            self._includers = includers
+        return self._includers
+
+    # The keys of the translation units that include 'path' (directly or
+    # not), or whose main file it is.
+    #
+    def includersOf(self, path):
+        id = self._ids.get(os.path.realpath(path))
+        if id is None:
+            return set()
+        return set(self.files[unit] for unit in self._reverse().get(id, ()))
+
+    # The translation units that any of 'files' are a part of. Same as
+    # changes.ReverseIncludeGraph.unitsAffectedBy.
+    #
+    def unitsAffectedBy(self, files):
+        affected = set()
+        for path in files:
+            affected |= self.includersOf(path)
+        return affected
+
+    # For each header included by the translation units 'keys', the one of
+    # those translation units that's to deal with it: the first, in order
+    # of key. Translation units whose entries are stale are left out, since
+    # what they include now isn't known. Returns a dict of header path -->
+    # key.
+    #
+    def owners(self, keys, flagsByKey):
+        times = {}
+        owners = {}
+        for key in sorted(keys):
+            if self.isStale(key, flagsByKey[key], times):
+                continue
+            _, sources, _ = self._units[self._ids[key]]
+            main = os.path.realpath(key)
+            for source in sources:
+                path = self.files[source]
+                if path != main:
+                    owners.setdefault(path, key)
+        return owners
+
+    # Only the files that some translation unit refers to are saved, so
+    # removing translation units doesn't leave the file table to grow
+    # forever.
+    #
+    def save(self, path):
+        renumbered = {}
+        files = []
+        def renumber(id):
+            if id not in renumbered:
+                renumbered[id] = len(files)
+                files.append(self.files[id])
+            return renumbered[id]
+
+        unitFiles = array('i')
+        unitFlags = array('i')
+        unitStarts = array('i', [0])
+        sources = array('i')
+        sourceTimes = array('d')
+        for unit in sorted(self._units, key=lambda id: self.files[id]):
+            hash, unitSources, times = self._units[unit]
+            unitFiles.append(renumber(unit))
+            unitFlags.append(hash)
+            sources.extend(renumber(source) for source in unitSources)
+            sourceTimes.extend(times)
+            unitStarts.append(len(sources))
+
+        columnfile.save(path, _magic, {'files': files},
+                        [('unitFiles', unitFiles),
+                         ('unitFlags', unitFlags),
+                         ('unitStarts', unitStarts),
+                         ('sources', sources),
+                         ('sourceTimes', sourceTimes)])
+
+    @staticmethod
+    def load(path):
+        header, columns = columnfile.load(path, _magic)
+        graph = IncludeGraph()
+        for name in header['files']:
+            graph.fileId(asStr(name))
+
+        starts = columns['unitStarts']
+        sources = columns['sources']
+        times = columns['sourceTimes']
+        for u, (unit, hash) in enumerate(zip(columns['unitFiles'],
+                                             columns['unitFlags'])):
+            begin, end = starts[u], starts[u + 1]
+            graph._units[unit] = (hash, sources[begin:end], times[begin:end])
+        return graph
+
+    # The index in 'path', or an empty one if there isn't one (or it's
+    # unreadable, in which case everything will be reindexed).
+    #
+    @staticmethod
+    def loadOrCreate(path):
+        try:
+            return IncludeGraph.load(path)
+        except (IOError, OSError, ValueError, KeyError, columnfile.ColumnFileError):
+            return IncludeGraph()
+
+# An observer.FileFilter (or anything like one) that also rejects function
+# definitions at namespace scope in headers that another translation unit
+# in the batch owns (see IncludeGraph.owners): that translation unit will
+# find whatever rewrites they need. Class definitions are never rejected,
+# since some fixers need to know what's in them (fix-init-order needs the
+# order of their fields). 'fileFilter' may be None, meaning everything.
+#
+class OwnerFilter(object):
+    _kinds = definitionKinds - set(kind.value for kind in (
+                                      CursorKind.CLASS_DECL,
+                                      CursorKind.STRUCT_DECL,
+                                      CursorKind.UNION_DECL,
+                                      CursorKind.CLASS_TEMPLATE,
+                                      CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION))
+
+    def __init__(self, fileFilter, owners, key):
+        self.fileFilter = fileFilter
+        self.owners = owners
+        self.key = key
+        self._ownedElsewhere = {} # filename --> bool
+
+    def _isOwnedElsewhere(self, filename):
+        answer = self._ownedElsewhere.get(filename)
+        if answer is None:
+            owner = self.owners.get(os.path.realpath(filename))
+            answer = owner is not None and owner != self.key
+            self._ownedElsewhere[filename] = answer
+        return answer
+
+    def accepts(self, cursor):
+        if self.fileFilter is not None and not self.fileFilter.accepts(cursor):
+            return False
+        if cursor._kind_id not in self._kinds:
+            return True
+        fileName = cursor.fileName
+        return fileName is None \
+               or not self._isOwnedElsewhere(fileName) \
+               or not cursor.is_definition()
+
+# Bringing an index up to date means parsing translation units, which is
+# done across a pool of workers the same way as in batch.py. Nothing but
+# the preprocessor can #include anything, so nothing else is needed.
+#
+_index = None
+
+def _initWorker():
+    global _index
+    _index = Index.create()
+
+def _indexJob(job):
+    directory, filepath, flags = job
+    try:
+        os.chdir(directory)
+        transUnit = fixer.getTranslationUnit(filepath,
+                                             fixer.hardcodedFlags + flags,
+                                             _index,
+                                             options=fixer.parseOptionsFor(set()))
+        sources = [os.path.abspath(source) for source in sourcesOf(filepath, transUnit)]
+        return incremental.unitKey(directory, filepath), flags, sources, None
+    except TranslationUnitLoadError as error:
+        return incremental.unitKey(directory, filepath), flags, None, str(error)
+
+# Bring 'graph' up to date with 'jobs' (see batch.getJobs): drop the
+# translation units that aren't among them anymore, and (re)index the ones
+# that are new or stale. Returns the number indexed and a list of
+# (filepath, error message) for those that couldn't be parsed.
+#
+def update(graph, jobs, processes):
+    keys = dict((incremental.unitKey(directory, filepath), flags) \
+                for directory, filepath, flags in jobs)
+    for key in graph.units - set(keys):
+        graph.removeUnit(key)
+
+    times = {}
+    stale = [job for job in jobs \
+             if graph.isStale(incremental.unitKey(job[0], job[1]), job[2], times)]
+
+    if processes == 1:
+        _initWorker()
+        results = (_indexJob(job) for job in stale)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_initWorker)
+        results = pool.imap_unordered(_indexJob, stale)
+
+    failures = []
+    try:
+        for key, flags, sources, error in results:
+            if error is None:
+                graph.setUnit(key, flags, sources)
+            else:
+                graph.removeUnit(key)
+                failures.append((key, error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return len(stale), failures
@@ -0,0 +1,141 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# What a previous run over a compilation database saw, so that the next run
+# can skip the translation units that haven't changed since. The state file
+# is JSON:
+#
+#     {"version": 1,
+#      "units": {"/abs/path/of/foo.cpp":
+#                    {"flags": [...],
+#                     "settings": {...},  # which fixers, and how
+#                     "hashes": {"/abs/path/of/foo.cpp": "<sha1>",
+#                                "/abs/path/of/foo.h": "<sha1>", ...}},
+#                ...}}
+#
+# where the hashes are of the main file and of everything it included
+# (TranslationUnit.get_includes), as they were once the translation unit had
+# been fixed. A translation unit is unchanged if its flags and settings are
+# the same and every one of those files still has the same hash. Only
+# translation units that were dealt with successfully are recorded, and none
+# with --diff, since that leaves the sources as they were.
+#
+
+import json
+import os
+
+from astcache import hashFile, sourcesOf
+
+_version = 1
+
+# What about a run's arguments could change what the fixers do.
+#
+def settingsOf(args):
+    return {'fixers': sorted(args.fixers or []),
+            'noTodo': bool(args.noTodo),
+            'headers': bool(args.headers),
+            'fromDiagnostics': bool(args.fromDiagnostics),
+            'inPlace': bool(args.inPlace)}
+
+# The key of a translation unit: the absolute path of its main file.
+#
+def unitKey(directory, filepath):
+    return os.path.normpath(os.path.join(directory, filepath))
+
+# Hashes of file contents, each file hashed at most once.
+#
+class FileHashes(object):
+    def __init__(self):
+        self._hashes = {}
+
+    def __call__(self, path):
+        if path not in self._hashes:
+            try:
+                self._hashes[path] = hashFile(path)
+            except (IOError, OSError):
+                self._hashes[path] = None # Deleted? That's a change too.
+        return self._hashes[path]
+
+# The absolute paths and hashes of the main file and everything it includes.
+# Relative paths are relative to the current directory, so call this from
+# the translation unit's directory.
+#
+def hashSources(filepath, transUnit, hashes):
+    return dict((path, hashes(path)) \
+                for path in (os.path.abspath(source) \
+                             for source in sourcesOf(filepath, transUnit)))
+
+class State(object):
+    def __init__(self, path):
+        self.path = os.path.abspath(path) # the jobs chdir all over the place
+        self.units = {}
+        self.hits = 0
+        self.misses = 0
+        self._hashes = FileHashes()
+        try:
+            with open(path, 'r') as file:
+                contents = json.load(file)
+            if contents.get('version') == _version:
+                self.units = contents['units']
+        except (IOError, OSError, ValueError, KeyError):
+            pass # No state (or no usable state) means everything's changed.
+
+    def isUnchanged(self, key, flags, settings):
+        unit = self.units.get(key)
+        unchanged = unit is not None \
+                    and unit['flags'] == flags \
+                    and unit['settings'] == settings \
+                    and all(self._hashes(path) == digest \
+                            for path, digest in unit['hashes'].iteritems())
+        if unchanged:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return unchanged
+
+    def record(self, key, flags, settings, hashes):
+        self.units[key] = {'flags': flags, 'settings': settings, 'hashes': hashes}
+
+    # Headers are rewritten at the end of a run, after the translation units
+    # that include them were hashed. 'changes' is real path --> (hash before,
+    # hash after) for each header rewritten in place. A unit that saw a
+    # header as it was before now sees it as it is, so that the fixers' own
+    # rewrites don't make it look changed next time. A unit that saw some
+    # other version of it is left alone.
+    #
+    def rewritten(self, changes):
+        realPaths = {}
+        for unit in self.units.itervalues():
+            hashes = unit['hashes']
+            for path, digest in hashes.items():
+                if path not in realPaths:
+                    realPaths[path] = os.path.realpath(path)
+                change = changes.get(realPaths[path])
+                if change is not None and digest == change[0]:
+                    hashes[path] = change[1]
+
+    # Write the state out, atomically, so that a run that's killed halfway
+    # through doesn't leave a state file that's half written.
+    #
+    def save(self):
+        directory = os.path.dirname(self.path)
+        temp = os.path.join(directory, '.{}.{}.tmp'.format(os.path.basename(self.path),
+                                                           os.getpid()))
+        with open(temp, 'w') as file:
+            json.dump({'version': _version, 'units': self.units}, file)
+        os.rename(temp, self.path)
@@ -0,0 +1,64 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+import argparse
+import batch
+import includegraph
+import multiprocessing
+import os
+import time
+from fileprinter import printf
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build (or bring up to date) an index of which translation units in '
+                    'a compilation database include which files, for use with '
+                    "fix-compilation-database.py's --include-index.")
+    parser.add_argument('buildDir', type=str,
+                        help='Directory containing compile_commands.json.')
+    parser.add_argument('--index', dest='index', action='store', required=True,
+                        help='The index file. Only the translation units that are new, '
+                             'or that include something modified since it was written, '
+                             'are parsed.')
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='Number of worker processes.')
+    parser.add_argument('--query', dest='query', nargs='+', metavar='FILE',
+                        help="Don't update the index; print the translation units that "
+                             "include each of these files instead.")
+    args = parser.parse_args()
+    args.index = os.path.abspath(args.index) # the jobs chdir all over the place
+
+    graph = includegraph.IncludeGraph.loadOrCreate(args.index)
+
+    if args.query:
+        for path in args.query:
+            printf('{}:', path)
+            for key in sorted(graph.includersOf(path)):
+                printf('    {}', key)
+    else:
+        start = time.time()
+        indexed, failures = includegraph.update(graph,
+                                                batch.getJobs(args.buildDir),
+                                                args.jobs)
+        graph.save(args.index)
+        for key, error in failures:
+            printf('FAILED {}: {}', key, error)
+        printf('{} translation units in the index, {} (re)indexed in {:.1f} seconds',
+               len(graph.units), indexed, time.time() - start)
@@ -16,13 +16,140 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import sys
+
+import clangwrapper # for the side effect of telling clang where libclang is
+from clang.cindex import conf, callbacks, Cursor, CursorKind
+from clangwrapper import CachedCursor, cached
+from ctypes import addressof, sizeof, string_at
+
+# Return values for a clang_visitChildren visitor.
+#
+CXChildVisit_Break = 0
+CXChildVisit_Continue = 1
+CXChildVisit_Recurse = 2
+
+# The visitor is handed back, as a child's parent, exactly the cursor it was
+# earlier handed as that child, so comparing the raw bytes of the two cursors
+# is enough to tell them apart -- no need for clang_equalCursors.
+#
+def _cursorKey(c):
+    return string_at(addressof(c), sizeof(c))
+
+# Which files a traversal should bother with. System headers are never
+# interesting. If 'filenames' is given, then only cursors in those files are;
+# otherwise any cursor outside of a system header is.
+#
+class FileFilter(object):
+    def __init__(self, filenames=None):
+        self.filenames = None if filenames is None else set(filenames)
+
+    def accepts(self, cursor):
+        # This is one call into libclang, whereas getting at the file name
+        # takes a few, so try it first.
+        if cursor.location.is_in_system_header:
+            return False
+        if self.filenames is None:
+            return True
+        return cursor.fileName in self.filenames
+
+    # Whether the filter accepts nothing at all, so that there's no point in
+    # traversing.
+    #
+    def isEmpty(self):
+        return self.filenames is not None and len(self.filenames) == 0
+
+    # A filter that accepts whatever any of 'filters' accept. None (meaning
+    # "don't filter at all") swallows everything else.
+    #
+    @staticmethod
+    def union(filters):
+        filters = list(filters)
+        if len(filters) == 0 or None in filters:
+            return None
+        if any(f.filenames is None for f in filters):
+            return FileFilter()
+        return FileFilter(set().union(*(f.filenames for f in filters)))
+
+# The children of these can come from different files (think of #include
+# inside of a namespace, or of the translation unit itself). The children of
+# anything else are in the same file as their parent, so they needn't be
+# checked against a FileFilter.
+#
+scopeKinds = set(kind.value for kind in (CursorKind.TRANSLATION_UNIT,
+                                          CursorKind.NAMESPACE,
+                                          CursorKind.LINKAGE_SPEC,
+                                          CursorKind.UNEXPOSED_DECL))
+
 # I define "observers" so I can use them to "traverse" the AST.
 #
-def traverse(c, observer):
+# This makes a single clang_visitChildren call that recurses over the whole
+# tree. There's no Python recursion and no list of children built per cursor.
+# Instead an explicit stack of ancestors is kept, and whenever clang hands us
+# a cursor whose parent isn't on top of the stack, we've finished with
+# whatever is on top, so we pop it.
+#
+# If a FileFilter is given, then subtrees in files it doesn't accept are
+# skipped entirely: the observer never sees them, and clang never visits them.
+#
+# The observer is handed clangwrapper.CachedCursors, so that observers (and
+# the filter) asking the same things of a cursor don't each go to libclang.
+#
+# A snapshot.SnapshotCursor has no libclang behind it, so it walks itself.
+#
+def traverse(c, observer, fileFilter=None):
+    c = cached(c)
+    if not isinstance(c, CachedCursor):
+        return c.traverse(observer, fileFilter)
+
+    tu = c.cursor._tu
+    stack = [c]
+    keys = [_cursorKey(c.cursor)]
+    failure = []
+
+    def visitor(child, parent, _):
+        try:
+            parentKey = _cursorKey(parent)
+            while keys[-1] != parentKey:
+                keys.pop()
+                observer.popTo(stack.pop())
+
+            child._tu = tu
+            cachedChild = CachedCursor(child)
+            if fileFilter is not None \
+               and stack[-1]._kind_id in scopeKinds \
+               and not fileFilter.accepts(cachedChild):
+                return CXChildVisit_Continue
+
+            observer.observe(cachedChild)
+            observer.pushFrom(cachedChild)
+            stack.append(cachedChild)
+            keys.append(_cursorKey(child))
+            return CXChildVisit_Recurse
+        except:
+            # An exception can't make it back out through libclang, so hold
+            # onto it, stop visiting, and raise it once we're out.
+            failure.append(sys.exc_info())
+            return CXChildVisit_Break
+
+    observer.observe(c)
+    observer.pushFrom(c)
+    conf.lib.clang_visitChildren(c.cursor, callbacks['cursor_visit'](visitor), None)
+    if failure:
+        excType, excValue, excTraceback = failure[0]
+        raise excType, excValue, excTraceback
+
+    while stack:
+        observer.popTo(stack.pop())
+
+# The original traversal: one call (and one list of children) per cursor.
+# Kept around for comparison; see benchmark.py.
+#
+def recursiveTraverse(c, observer):
     observer.observe(c)
     observer.pushFrom(c)
     for child in c.get_children():
-        traverse(child, observer)
+        recursiveTraverse(child, observer)
     observer.popTo(c)
 
 
@@ -63,18 +190,19 @@ class ObserverGroup(Observer):
         for observer in self.observers:
             observer.popTo(cursor)
 
-import sys
 import fileprinter
 
 def repeatedString(s, n):
     return ''.join(s for _ in range(n))
 
 def printCursor(c, printer=fileprinter.printf, indentLevel=0, tabWidth=4, tokenLineLimit=100):
+    c = cached(c)
     indent = repeatedString(' ', indentLevel * tabWidth)
     tokensRep = ' '.join('"{}"'.format(token.spelling) \
                          for token in c.get_tokens())
     semantic_parent = c.semantic_parent
     definition = c.get_definition()
+    start, end = c.extent.start, c.extent.end
     printer('{}{} ({}) ({}) (hash {}) (refs {}) ({}) {}.{}({})-{}.{}({})',
                 indent,
                 c.kind,
@@ -83,12 +211,12 @@ def printCursor(c, printer=fileprinter.printf, indentLevel=0, tabWidth=4, tokenL
                 c.canonical.hash,
                 definition.hash if definition else '',
                 semantic_parent.displayname if semantic_parent else '',
-                c.extent.start.line,
-                c.extent.start.column,
-                c.extent.start.offset,
-                c.extent.end.line,
-                c.extent.end.column,
-                c.extent.end.offset)
+                start.line,
+                start.column,
+                c.startOffset,
+                end.line,
+                end.column,
+                c.endOffset)
 
     if len(tokensRep) > tokenLineLimit:
         # tokensRep = tokensRep[:tokenLineLimit - 3] + '...'
@@ -111,7 +239,7 @@ class TreePrinter(Observer):
 
     def _ignore(self, c):
         return len(self.whitelist) > 0 \
-            and nameOrBlank(c.location.file) not in self.whitelist
+            and (c.fileName or '') not in self.whitelist
 
     def observe(self, c):
         if self._ignore(c):
@@ -18,7 +18,7 @@
 #!/usr/bin/python
 
 import fixer
-from observer import traverse, TreePrinter
+from observer import traverse, TreePrinter, FileFilter
 
 def printToken(token):
    s = '"{}"\t{}\t{}.{}({}) - {}.{}({})'.format(
@@ -44,5 +44,8 @@ if __name__ == '__main__':
     # then we print the tree here, and restrict it to the specified file.
     #
     if not args.verbose:
-        traverse(translationUnit.cursor, TreePrinter(whitelist=set([util.filepath])))
+        onlyThisFile = set([util.filepath])
+        traverse(translationUnit.cursor,
+                 TreePrinter(whitelist=onlyThisFile),
+                 FileFilter(onlyThisFile))
 
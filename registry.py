@@ -0,0 +1,176 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# When a batch of translation units is fixed, the same headers get
+# traversed by each translation unit that includes them, and the fixers
+# come to the same conclusions about them every time. A Registry remembers
+# which definitions in headers have already been analyzed, keyed by
+# (USR, hash of the header's contents), so that later translation units can
+# skip them entirely: the rewrites they'd find were already found.
+#
+# What's skipped is a definition at namespace scope (a class, a function,
+# an out-of-line member function) in any file other than the main file.
+# Some fixers need to know things about what was skipped; fix-init-order
+# needs a class's field order to check a constructor in the main file. So
+# the registry keeps that too (see fieldOrder).
+#
+# The registry's entries can be shared between processes: hand it a
+# multiprocessing.Manager().dict() (see batch.py). Entries are only
+# published there by commit(), which is meant to be called once a
+# translation unit has been dealt with successfully, so that nothing is
+# skipped on account of a translation unit whose rewrites were lost.
+#
+
+from astcache import hashFile
+from clangwrapper import CursorKind
+from observer import Observer, scopeKinds
+
+# The kinds of definitions that can be skipped.
+#
+definitionKinds = set(kind.value for kind in (CursorKind.CLASS_DECL,
+                                               CursorKind.STRUCT_DECL,
+                                               CursorKind.UNION_DECL,
+                                               CursorKind.CLASS_TEMPLATE,
+                                               CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION,
+                                               CursorKind.FUNCTION_DECL,
+                                               CursorKind.FUNCTION_TEMPLATE,
+                                               CursorKind.CXX_METHOD,
+                                               CursorKind.CONSTRUCTOR,
+                                               CursorKind.DESTRUCTOR,
+                                               CursorKind.CONVERSION_FUNCTION))
+
+class Registry(object):
+    def __init__(self, shared=None):
+        self._shared = shared  # dict-like, maybe in another process
+        self._entries = {}     # what we know, including from _shared
+        self._pending = {}     # what we've learned but not yet committed
+        self._hashes = {}      # filename --> hash of its contents
+
+    def fileHash(self, filename):
+        digest = self._hashes.get(filename)
+        if digest is None:
+            digest = hashFile(filename)
+            self._hashes[filename] = digest
+        return digest
+
+    # The key of 'cursor', or None if it can't have one.
+    #
+    def keyOf(self, cursor):
+        fileName = cursor.fileName
+        usr = cursor.get_usr()
+        if fileName is None or not usr:
+            return None
+        return (usr, self.fileHash(fileName))
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            value = self._pending.get(key)
+        if value is None and self._shared is not None:
+            value = self._shared.get(key)
+            if value is not None:
+                self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        self._pending[key] = value
+
+    # Publish what this translation unit learned.
+    #
+    def commit(self):
+        if self._shared is not None and self._pending:
+            self._shared.update(self._pending)
+        self._entries.update(self._pending)
+        self._pending.clear()
+
+    # Forget what this translation unit learned.
+    #
+    def discard(self):
+        self._pending.clear()
+
+    def isDone(self, cursor):
+        key = self.keyOf(cursor)
+        return key is not None and self.get(('done',) + key) is not None
+
+    def markDone(self, cursor):
+        key = self.keyOf(cursor)
+        if key is not None:
+            self.put(('done',) + key, True)
+
+    # Remember the USRs of the fields of 'record' (a class definition), in
+    # order.
+    #
+    def putFields(self, record, fields):
+        key = self.keyOf(record)
+        if key is not None:
+            self.put(('fields',) + key, [field.get_usr() for field in fields])
+
+    # Where the field 'field' (a FIELD_DECL) is in its class's definition,
+    # if that class has been seen, else None.
+    #
+    def fieldOrder(self, field):
+        record = field.semantic_parent
+        key = None if record is None else self.keyOf(record)
+        if key is None:
+            return None
+        fields = self.get(('fields',) + key)
+        usr = field.get_usr()
+        if fields is None or usr not in fields:
+            return None
+        return fields.index(usr)
+
+# Whether 'cursor' is a definition that a Registry could skip; 'cursor' is
+# assumed to be the child of a scope.
+#
+def _isSkippable(cursor, mainFile):
+    if cursor._kind_id not in definitionKinds:
+        return False
+    fileName = cursor.fileName
+    return fileName is not None and fileName != mainFile and cursor.is_definition()
+
+# An observer.FileFilter (or anything like one) that also rejects whatever
+# 'registry' says is done. 'fileFilter' may be None, meaning everything.
+#
+class SeenFilter(object):
+    def __init__(self, fileFilter, registry, mainFile):
+        self.fileFilter = fileFilter
+        self.registry = registry
+        self.mainFile = mainFile
+
+    def accepts(self, cursor):
+        if self.fileFilter is not None and not self.fileFilter.accepts(cursor):
+            return False
+        return not (_isSkippable(cursor, self.mainFile) and self.registry.isDone(cursor))
+
+# Marks each skippable definition done once the traversal is through with it.
+#
+class SeenObserver(Observer):
+    def __init__(self, registry, mainFile):
+        super(SeenObserver, self).__init__()
+        self.registry = registry
+        self.mainFile = mainFile
+        self._kinds = [] # of the cursors we're within
+
+    def pushFrom(self, cursor):
+        self._kinds.append(cursor._kind_id)
+
+    def popTo(self, cursor):
+        self._kinds.pop()
+        if self._kinds and self._kinds[-1] in scopeKinds \
+           and _isSkippable(cursor, self.mainFile):
+            self.registry.markDone(cursor)
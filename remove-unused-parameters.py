@@ -17,17 +17,21 @@
 '''
 #!/usr/bin/python
 
-from clangwrapper import CursorKind, Cursor, Diagnostic, HashableCursor
-from observer import traverse, Observer, ObserverGroup, printCursor
+from clangwrapper import CursorKind, Cursor, Diagnostic
+from observer import traverse, Observer, ObserverGroup, FileFilter, printCursor
+from fileprinter import printf, printerr
+from tokenindex import tokensFor
+from collections import defaultdict
+import fixer
+import seeds
 
 class Function:
     def __init__(self, cursor):
         self.cursor = cursor
         self.hasBody = False
-        self.parameterMentions = dict() # HashableCursor --> int
+        self.parameterMentions = dict() # cursor --> int
 
     def addParam(self, cursor):
-        cursor = HashableCursor(cursor)
         assert cursor not in self.parameterMentions # Redundant?
         self.parameterMentions[cursor] = 0
 
@@ -36,8 +40,6 @@ class Function:
         if not definition:
             return # Can't see what this ref refers to.
 
-        definition = HashableCursor(definition)
-
         if definition in self.parameterMentions:
             self.parameterMentions[definition] += 1
 
@@ -73,7 +75,7 @@ class Stack(list):
 class FindUnusedParameters(Observer):
     def __init__(self):
         super(FindUnusedParameters, self).__init__()
-        self.unusedParameters = set() # of HashableCursor
+        self.unusedParameters = set() # of cursors
         self._functionObservers = Stack() # of FunctionObserver
 
     def observe(self, cursor):
@@ -158,63 +160,97 @@ class FunctionObserver:
         elif kind == CursorKind.DECL_REF_EXPR:
             self._observeRef(childCursor)
 
-def eponymousToken(cursor):
+# 'tokens' is a tokenindex.TranslationUnitTokens. Returns a
+# tokenindex.IndexedToken.
+#
+def eponymousToken(cursor, tokens):
     if not cursor.displayname:
         return None # Of course nothing will match
 
     matches = [token \
-               for token in cursor.get_tokens() \
+               for token in tokens.tokensOf(cursor) \
                if token.spelling == cursor.displayname]
 
     # "assert" might be too harsh.
     # assert len(matches) > 0
     if len(matches) == 0:
         printerr('WARNING The following cursor does not have an eponymous token:')
-        printerr(cursor.location.file.name)
+        printerr(cursor.fileName)
         printCursor(cursor, printerr)
         return None
                        # Take the last rather than the first, 
     return matches[-1] # in case the parameter shares its name with a type.
 
 
-if __name__ == '__main__':
-    from fileprinter import printf, printerr
+def rewritesByFile(unusedParameters, tokens):
+    rewrites = defaultdict(list)
 
-    import fixer
-    util = fixer.Fixer('Remove unused parameter variables from function definitions.')
-    args, translationUnit = util.setup()
-    inFilepath = util.filepath
+    for cursor in unusedParameters:
+        token = eponymousToken(cursor, tokens)
+        if not token:
+            continue
+        startOffset = token.startOffset
+        endOffset = token.endOffset
+        rewrite = (startOffset, endOffset - startOffset, '')
+        rewrites[token.filename].append(rewrite)
+
+    return rewrites
+
+# With --from-diagnostics, the unused parameters are the ones clang warned
+# about (-Wunused-parameter), so there's nothing to traverse. The cursor at
+# each warning is the parameter, and its semantic parent the function.
+#
+def warnedParameters(transUnit, filenames):
+    parameters = set() # of cursors
+    for diag in seeds.diagnosticsFor(transUnit, '-Wunused-parameter', filenames):
+        cursor = seeds.cursorAt(transUnit, diag.location)
+        if cursor is None or cursor.kind != CursorKind.PARM_DECL:
+            printerr('WARNING Found no parameter for this warning: {}', diag)
+        elif len(cursor.spelling) and isFunction(cursor.semantic_parent):
+            parameters.add(cursor)
+    return parameters
+
+# The observer that finds unused parameters, and a function that turns
+# what it found into rewrites once the traversal is done.
+# See fixer.Pass.
+#
+def getPass(transUnit, args, registry=None):
+    if args.fromDiagnostics:
+        filenames = None if args.headers else set([transUnit.spelling])
+        def seededFinish():
+            return rewritesByFile(warnedParameters(transUnit, filenames),
+                                  tokensFor(transUnit))
+        return fixer.Pass(Observer(), seededFinish, FileFilter([]))
 
     finder = FindUnusedParameters()
-    traverse(translationUnit.cursor, finder)   
 
-    from collections import defaultdict
+    def finish():
+        return rewritesByFile(finder.unusedParameters, tokensFor(transUnit))
 
-    def rewritesByFile(unusedParameters):
-        rewrites = defaultdict(list)
+    # Unless the headers are going to be rewritten too, don't bother with
+    # them.
+    fileFilter = FileFilter() if args.headers else FileFilter([transUnit.spelling])
+    return fixer.Pass(finder, finish, fileFilter)
 
-        for cursor in unusedParameters:
-            token = eponymousToken(cursor)
-            if not token:
-                continue
-            startOffset = token.extent.start.offset
-            endOffset = token.extent.end.offset
-            rewrite = (startOffset, endOffset - startOffset, '')
-            rewrites[token.location.file.name].append(rewrite)
+# Whether a parameter is used is in the function's body. Templates are
+# analyzed as written, not as instantiated.
+#
+parseNeeds = set([fixer.FUNCTION_BODIES])
 
-        return rewrites
+# Find the names of unused parameters in a translation unit.
+# Returns a dict of filename --> list of rewrites.
+#
+def findRewrites(transUnit, args):
+    return fixer.runPasses(transUnit, [getPass(transUnit, args)])
 
-    rewrites = rewritesByFile(finder.unusedParameters)
 
-    from rewrite import rewrite
-    for filename, rewrites in rewrites.iteritems():
-        if filename != inFilepath:
-            printf('Skipping file {}', filename)
-            continue
-        elif len(rewrites) == 0:
-            continue
-        with open(filename, 'r') as fin:
-            printf('Rewriting file {}', filename)
-            with open(filename + '.rewrite', 'w') as fout:
-                rewrite(fin, fout, rewrites)
+if __name__ == '__main__':
+    util = fixer.Fixer('Remove unused parameter variables from function definitions.',
+                       parseNeeds)
+    util.setup()
+
+    def fix(args, translationUnit):
+        rewrites = findRewrites(translationUnit, args)
+        util.writeRewrites(rewrites, printf)
 
+    util.run(fix)
@@ -16,18 +16,278 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-def rewrite(fin, fout, rewrites, alreadySorted=False):
+import os
+import stat
+import tempfile
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+# A rewrite is a tuple (offset, length, replacement): replace the 'length'
+# bytes at 'offset' with 'replacement'. A length of zero is an insertion.
+
+# Two rewrites of the same file that can't both be applied: their ranges
+# overlap, or they insert different text at the same offset. If 'second' is
+# None, then 'first' runs past the end of the file.
+#
+Conflict = namedtuple('Conflict', ['first', 'second'])
+
+def describeConflict(conflict):
+    first, second = conflict
+    if second is None:
+        return '{} runs past the end of the file'.format(first)
+    return '{} conflicts with {}'.format(first, second)
+
+class RewriteConflictError(Exception):
+    def __init__(self, filename, conflicts):
+        self.filename = filename
+        self.conflicts = conflicts
+        super(RewriteConflictError, self).__init__(
+            '{}: {} conflicting rewrites, e.g. {}'.format(filename or '<input>',
+                                                          len(conflicts),
+                                                          describeConflict(conflicts[0])))
+
+# Sort 'rewrites' and drop exact duplicates (when several fixers want the
+# same thing done, it only gets done once). Raises RewriteConflictError,
+# listing every conflict, if what's left can't all be applied to a file of
+# 'size' bytes. An insertion at the start or end of another rewrite's range
+# is fine; it goes before or after it, respectively.
+#
+def merge(rewrites, size, filename=None, alreadySorted=False):
     if not alreadySorted:
-        def selectOffset(tup):
-            return tup[0]
-        rewrites = sorted(rewrites, key=selectOffset)
+        rewrites = sorted(rewrites)
+
+    merged = []
+    conflicts = []
+    previous = (-1, -1, None)
+    previousEnd = -1
+    for rewrite in rewrites:
+        offset, oldLen, _ = rewrite
+        end = offset + oldLen
+        if offset < previousEnd \
+           or (oldLen == 0 and offset == previousEnd and previous[1] == 0) \
+           or offset < 0 or oldLen < 0 or end > size:
+            if rewrite == previous:
+                continue
+            elif offset < 0 or oldLen < 0 or end > size:
+                conflicts.append(Conflict(rewrite, None))
+            else:
+                conflicts.append(Conflict(previous, rewrite))
+            continue
+        merged.append(rewrite)
+        previous = rewrite
+        previousEnd = end
+
+    if conflicts:
+        raise RewriteConflictError(filename, conflicts)
+    return merged
+
+# Return 'text' with 'rewrites' applied. Each unchanged stretch of 'text' is
+# sliced out once and everything is joined at the end.
+#
+def applyRewrites(text, rewrites, filename=None, alreadySorted=False):
+    pieces = []
+    position = 0
+    for offset, oldLen, replacement in merge(rewrites, len(text), filename, alreadySorted):
+        pieces.append(text[position:offset]) # catch up
+        pieces.append(replacement)
+        position = offset + oldLen # skip the old
+    pieces.append(text[position:]) # the rest of it
+    return ''.join(pieces)
+
+# Read all of 'fin', apply 'rewrites' to it, and write the result to 'fout'
+# in one go.
+#
+def rewrite(fin, fout, rewrites, alreadySorted=False, filename=None):
+    fin.seek(0)
+    fout.write(applyRewrites(fin.read(), rewrites, filename, alreadySorted))
+
+# The offset at which each line of 'text' starts.
+#
+def _lineStarts(text):
+    starts = array('l', [0])
+    position = text.find('\n')
+    while position != -1:
+        starts.append(position + 1)
+        position = text.find('\n', position + 1)
+    return starts
+
+def _hunkRange(start, count):
+    # A hunk that's empty on one side is numbered by the line before it.
+    if count == 0:
+        return '{},0'.format(start)
+    elif count == 1:
+        return '{}'.format(start + 1)
+    return '{},{}'.format(start + 1, count)
+
+def _diffLines(prefix, lines, out):
+    for line in lines:
+        out.append(prefix + line)
+        if not line.endswith('\n'):
+            out.append('\n\\ No newline at end of file\n')
+
+# A unified diff (with 'context' lines of context) of what applying
+# 'rewrites' to 'text' would do, labeled with 'path' as git labels things.
+# It's built from the rewrites alone: only the lines that they touch, and
+# the context around those, are ever looked at. Returns '' if nothing would
+# change.
+#
+def unifiedDiff(path, text, rewrites, context=3, alreadySorted=False):
+    rewrites = merge(rewrites, len(text), path, alreadySorted)
+    lineStarts = _lineStarts(text)
+    if text == '' or text.endswith('\n'):
+        lineStarts.pop() # there's no line after the last newline
+    lineCount = len(lineStarts)
+    lineStarts.append(len(text)) # so that lineStarts[lineCount] is the end
+
+    def lineOf(offset):
+        return bisect_right(lineStarts, offset, 0, lineCount) - 1
+
+    # Group the rewrites into changes, each of which covers whole lines
+    # [firstLine, endLine) and shares no line with any other.
+    groups = []
+    for rewrite in rewrites:
+        offset, oldLen, _ = rewrite
+        if offset == len(text) and (text == '' or text.endswith('\n')):
+            firstLine = lineCount # appending after the last line
+        else:
+            firstLine = lineOf(offset)
+        endLine = max(firstLine + 1, lineOf(offset + oldLen - 1) + 1)
+        if groups and firstLine < groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], endLine)
+            groups[-1][2].append(rewrite)
+        else:
+            groups.append([firstLine, endLine, [rewrite]])
+
+    # Each change, as (firstLine, endLine, old lines, new lines), leaving out
+    # any that don't actually change anything.
+    changes = []
+    for firstLine, endLine, groupRewrites in groups:
+        endLine = min(endLine, lineCount)
+        start = lineStarts[firstLine] if firstLine < lineCount else len(text)
+        old = text[start:lineStarts[endLine]] if firstLine < lineCount else ''
+        new = applyRewrites(old,
+                            [(offset - start, oldLen, replacement) \
+                             for offset, oldLen, replacement in groupRewrites],
+                            path,
+                            alreadySorted=True)
+        if new != old:
+            changes.append((firstLine, max(firstLine, endLine),
+                            old.splitlines(True), new.splitlines(True)))
+
+    def lines(first, end):
+        return text[lineStarts[first]:lineStarts[end]].splitlines(True)
+
+    # Changes close enough together that their context would meet go into
+    # the same hunk.
+    hunks = []
+    for change in changes:
+        if hunks and change[0] - hunks[-1][-1][1] <= 2 * context:
+            hunks[-1].append(change)
+        else:
+            hunks.append([change])
+
+    out = []
+    delta = 0 # how many more lines the new file has, so far
+    for hunk in hunks:
+        first = max(0, hunk[0][0] - context)
+        end = min(lineCount, hunk[-1][1] + context)
+        body = []
+        oldCount = newCount = 0
+        position = first
+        for firstLine, endLine, oldLines, newLines in hunk:
+            _diffLines(' ', lines(position, firstLine), body)
+            _diffLines('-', oldLines, body)
+            _diffLines('+', newLines, body)
+            oldCount += firstLine - position + len(oldLines)
+            newCount += firstLine - position + len(newLines)
+            position = endLine
+        _diffLines(' ', lines(position, end), body)
+        oldCount += end - position
+        newCount += end - position
+
+        out.append('@@ -{} +{} @@\n'.format(_hunkRange(first, oldCount),
+                                            _hunkRange(first + delta, newCount)))
+        out.extend(body)
+        delta += newCount - oldCount
+
+    if not out:
+        return ''
+    return ''.join(['diff --git a/{0} b/{0}\n'.format(path),
+                    '--- a/{}\n'.format(path),
+                    '+++ b/{}\n'.format(path)] + out)
+
+# How 'filename' is named in a diff: relative to 'base' (by default, the
+# current directory), the way git apply expects.
+#
+def diffPath(filename, base=None):
+    return os.path.relpath(os.path.abspath(filename), base or os.getcwd())
+
+# Write 'text' to 'filename' without anyone ever seeing half of it: write a
+# temporary file in the same directory, make sure it's on disk, and rename
+# it over the original. The original's permissions are kept.
+#
+def replaceFile(filename, text):
+    directory = os.path.dirname(os.path.abspath(filename))
+    descriptor, tempPath = tempfile.mkstemp(prefix='.' + os.path.basename(filename),
+                                            suffix='.tmp',
+                                            dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as fout:
+            fout.write(text)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.chmod(tempPath, stat.S_IMODE(os.stat(filename).st_mode))
+        os.rename(tempPath, filename)
+    except:
+        os.remove(tempPath)
+        raise
+
+# Write each file's rewritten version next to it, as <filename>.rewrite, or
+# over it if 'inPlace', or neither: if 'diffFile' is given, then a unified
+# diff of each file is written to that, with paths relative to 'diffBase'
+# (and nothing is printed, since that might well be stdout).
+#
+# Only files in 'filenames' are rewritten, unless it's None. Anything else
+# (headers, mostly) is reported and skipped. A file whose rewrites don't
+# change anything isn't written at all. Returns the names of the files
+# written (or diffed). Raises RewriteConflictError if a file's rewrites
+# conflict, before anything is written for that file.
+#
+def writeRewrites(rewritesByFile, filenames, printf, inPlace=False, diffFile=None,
+                  diffBase=None):
+    if diffFile is not None:
+        printf = _doNothing
+
+    written = []
+    for filename, rewrites in rewritesByFile.iteritems():
+        if filenames is not None and filename not in filenames:
+            printf('Skipping file {}', filename)
+            continue
+        elif len(rewrites) == 0:
+            continue
+        with open(filename, 'rb') as fin:
+            original = fin.read()
+
+        if diffFile is not None:
+            diff = unifiedDiff(diffPath(filename, diffBase), original, rewrites)
+            if diff:
+                diffFile.write(diff)
+                written.append(filename)
+            continue
 
-    fin.seek(0) 
-    FROM_CURRENT_POSITION = 1
-    for offset, oldLen, replacement in rewrites:
-        fout.write(fin.read(offset - fin.tell())) # catch up
-        fout.write(replacement)
-        fin.seek(oldLen, FROM_CURRENT_POSITION) # skip the old
+        text = applyRewrites(original, rewrites, filename)
+        if text == original:
+            continue
 
-    fout.write(fin.read()) # the rest of it
+        printf('Rewriting file {}', filename)
+        if inPlace:
+            replaceFile(filename, text)
+        else:
+            with open(filename + '.rewrite', 'wb') as fout:
+                fout.write(text)
+        written.append(filename)
+    return written
 
+def _doNothing(*args, **kwargs):
+    pass
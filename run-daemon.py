@@ -0,0 +1,44 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+import argparse
+import daemon
+from fileprinter import printf
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Keep libclang loaded and serve fix/print/show requests '
+                    'over a Unix domain socket. See ask-daemon.py.')
+    parser.add_argument('--socket', default=daemon.defaultSocketPath(),
+                        help='Path of the socket to listen on.')
+    parser.add_argument('--max-translation-units', dest='maxTranslationUnits',
+                        type=int, default=16,
+                        help='How many parsed translation units to keep around.')
+    parser.add_argument('--verbose', '-v', action='count',
+                        help='Log each request to stdout.')
+    args = parser.parse_args()
+
+    server = daemon.Server(args.socket, args.maxTranslationUnits, args.verbose)
+    printf('Listening on {}', args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,120 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Going straight from clang's warnings to the cursors they're about, rather
+# than traversing the whole translation unit to find them. Each warning's
+# location gives a cursor (Cursor.from_location), and from there it's a
+# matter of climbing parents to whatever the fixer wants.
+#
+# Works on snapshots too (see snapshot.Snapshot.cursorAtLocation).
+#
+
+import clangwrapper # for the side effect of telling clang where libclang is
+from clang.cindex import Cursor, CursorKind, TranslationUnit
+from clangwrapper import CachedCursor
+
+# The flags that make clang give the warnings that fixers can start from.
+# -Wunused-parameter isn't part of -Wall.
+#
+seedFlags = ['-Wreorder', '-Wswitch', '-Wunused-parameter']
+
+# The diagnostics for 'option' (e.g. '-Wreorder'), limited to those in
+# 'filenames' if it isn't None.
+#
+def diagnosticsFor(transUnit, option, filenames=None):
+    for diag in transUnit.diagnostics:
+        if diag.option != option:
+            continue
+        file = diag.location.file
+        if file is None or (filenames is not None and file.name not in filenames):
+            continue
+        yield diag
+
+# The innermost cursor at 'location' (as a clangwrapper.CachedCursor), or
+# None.
+#
+def cursorAt(transUnit, location):
+    if not isinstance(transUnit, TranslationUnit):
+        return transUnit.cursorAtLocation(location)
+    cursor = Cursor.from_location(transUnit, location)
+    if cursor.kind.is_invalid():
+        return None
+    return CachedCursor(cursor)
+
+def contains(cursor, location):
+    return cursor.fileName == location.file.name \
+       and cursor.startOffset <= location.offset <= cursor.endOffset
+
+# The first of 'cursor' and its semantic parents that's one of 'kinds'.
+#
+def semanticAncestor(cursor, kinds):
+    while cursor is not None and cursor.kind not in kinds:
+        cursor = cursor.semantic_parent
+    return cursor
+
+# The innermost statement of one of 'kinds' that contains 'location', e.g.
+# the SWITCH_STMT that a -Wswitch warning (which clang puts at the switch's
+# condition) is about. libclang gives statements and expressions no parents
+# of their own, lexical or otherwise; the nearest thing is their semantic
+# parent, the declaration they're in. So go up to that, and then back down,
+# into only the child that contains 'location' at each level. That's a walk
+# down one path of one function, however big the rest of the translation
+# unit is.
+#
+def enclosingStatement(transUnit, location, kinds):
+    cursor = cursorAt(transUnit, location)
+    if cursor is None:
+        return None
+    if cursor.kind in kinds:
+        return cursor
+
+    while cursor is not None and not cursor.kind.is_declaration():
+        cursor = cursor.semantic_parent
+
+    found = None
+    while cursor is not None:
+        if cursor.kind in kinds:
+            found = cursor
+        cursor = next((child for child in cursor.get_children() \
+                       if contains(child, location)), None)
+    return found
+
+# The definition of the constructor whose member initializer is at
+# 'location', which is where clang puts -Wreorder warnings. The cursor there
+# is a MEMBER_REF (or something inside of the initializer's arguments). A
+# reference has no parents, but the field it refers to has its class, and
+# the class has its constructors.
+#
+def enclosingConstructor(transUnit, location):
+    cursor = cursorAt(transUnit, location)
+    if cursor is None:
+        return None
+    if cursor.kind != CursorKind.MEMBER_REF:
+        return semanticAncestor(cursor, (CursorKind.CONSTRUCTOR,))
+
+    field = cursor.get_definition()
+    record = None if field is None else field.semantic_parent
+    if record is None:
+        return None
+    for child in record.get_children():
+        if child.kind != CursorKind.CONSTRUCTOR:
+            continue
+        definition = child.get_definition()
+        if definition is not None and contains(definition, location):
+            return definition
+    return None
@@ -16,27 +16,15 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-from observer import Observer, nameOrBlank, traverse
-from fileprinter import printf
-from fixer import Fixer
-from linearset import linearset
+#!/usr/bin/python
 
-# Collect the types as you go. 
-#
-class TypeGrabber(Observer):
-    def __init__(self, whitelist=set()):
-        super(TypeGrabber, self).__init__()
-        self.whitelist = whitelist
-        self.types = linearset()
-
-    def _ignore(self, c):
-        return len(self.whitelist) > 0 \
-            and nameOrBlank(c.location.file) not in self.whitelist
-
-    def observe(self, c):
-        if self._ignore(c):
-            return
-        self.types.add(c.type)
+import argparse
+import batch
+import fixer
+import multiprocessing
+import os
+import typecensus
+from fileprinter import printf, printerr
 
 # class Type:...
 # def kind(self):
@@ -65,26 +53,50 @@ class TypeGrabber(Observer):
 # def __eq__(self, other):
 # def __ne__(self, other):
 
-def printType(cppType, columnWidth, printer=printf):
-    printer('{{:<{0}}}{{:<{0}}}{{:<{0}}}'.format(columnWidth),
-            '"' + cppType.spelling + '"',
-            cppType.kind,
-            cppType.get_ref_qualifier())
+def printType(key, census, columnWidth, printer=printf):
+    kind, spelling = key
+    printer('{{:<{0}}}{{:<{0}}}{{:<{0}}}{{:>10}}{{:>10}}'.format(columnWidth),
+            '"' + spelling + '"',
+            kind,
+            census.refQualifiers[key],
+            census.counts[key],
+            census.units[key])
 
 if __name__ == '__main__':
-    util = Fixer('Print all of the types in a translation unit.')
-    util.add_argument('--column-width', dest='columnWidth', default=45,
-                      help='Width in characters of each output column')
-    args, translationUnit = util.setup()
+    parser = argparse.ArgumentParser(
+        description='Print all of the types in a C++ file, or in every translation unit '
+                    'in a compilation database, with how often each occurs.')
+    parser.add_argument('path', type=str,
+                        help='The source file, or a directory containing compile_commands.json.')
+    parser.add_argument('--flags-file', dest='flagsFile', action='store',
+                        help='Path to a file containing clang compiler flags separated by '
+                             'newlines. Only for a single source file.')
+    parser.add_argument('--column-width', dest='columnWidth', type=int, default=45,
+                        help='Width in characters of each output column')
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='Number of worker processes, for a compilation database.')
+    args = parser.parse_args()
 
-    grabber = TypeGrabber()
-    traverse(translationUnit.cursor, grabber)
+    if os.path.isdir(args.path):
+        jobs = batch.getJobs(args.path)
+        processes = args.jobs
+    else:
+        flags = fixer.getFlagsFromFile(args.flagsFile) if args.flagsFile else []
+        jobs = [(os.getcwd(), args.path, flags)]
+        processes = 1
 
-    if len(grabber.types):
-        printf('{{:<{0}}}{{:<{0}}}{{:<{0}}}'.format(args.columnWidth),
-               '---- Name ----', 
-               '---- Kind ----',
-               '---- Ref Qualifier ----')
-    for cppType in grabber.types:
-        printType(cppType, args.columnWidth)
+    census, failures = typecensus.censusOfJobs(jobs, processes)
+    for key, error in failures:
+        printerr('FAILED {}: {}', key, error)
 
+    if len(census):
+        printf('{{:<{0}}}{{:<{0}}}{{:<{0}}}{{:>10}}{{:>10}}'.format(args.columnWidth),
+               '---- Name ----',
+               '---- Kind ----',
+               '---- Ref Qualifier ----',
+               'Count',
+               'TUs')
+    for key, _ in census.mostCommon():
+        printType(key, census, args.columnWidth)
+    printf('{} types in {} translation units', len(census), census.translationUnits)
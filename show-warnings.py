@@ -17,8 +17,55 @@
 '''
 #!/usr/bin/python
 
+import argparse
+import batch
+import diagnostics
 import fixer
+import json
+import multiprocessing
+import os
+import sys
+from fileprinter import printf, printerr
+
+def printDiagnostic(diag, asJson):
+    if asJson:
+        sys.stdout.write(json.dumps(diag, sort_keys=True) + '\n')
+        sys.stdout.flush() # so that whoever's reading gets each as it comes
+    else:
+        printf('{}:{}:{}: {}: {}{}',
+               diag['file'], diag['line'], diag['column'], diag['severity'],
+               diag['message'], ' [{}]'.format(diag['option']) if diag['option'] else '')
 
 if __name__ == '__main__':
-    util = fixer.Fixer('Print -Wall warnings found by clang for a C++ file')
-    util.setup()
+    parser = argparse.ArgumentParser(
+        description='Print the warnings clang has for a C++ file, or for every translation '
+                    'unit in a compilation database, without analyzing anything else.')
+    parser.add_argument('path', type=str,
+                        help='The source file, or a directory containing compile_commands.json.')
+    parser.add_argument('--flags-file', dest='flagsFile', action='store',
+                        help='Path to a file containing clang compiler flags separated by '
+                             'newlines. Only for a single source file.')
+    parser.add_argument('--option', dest='options', action='append',
+                        help='Only print warnings for this option, e.g. "--option reorder" or '
+                             '"--option=-Wswitch". May be repeated. Errors are always printed.')
+    parser.add_argument('--json', action='count',
+                        help='Print each warning as a line of JSON.')
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='Number of worker processes, for a compilation database.')
+    args = parser.parse_args()
+
+    options = set(diagnostics.normalizeOption(option) for option in args.options or [])
+    if os.path.isdir(args.path):
+        jobs = batch.getJobs(args.path)
+        processes = args.jobs
+    else:
+        flags = fixer.getFlagsFromFile(args.flagsFile) if args.flagsFile else []
+        jobs = [(os.getcwd(), args.path, flags)]
+        processes = 1
+
+    for key, diags, error in diagnostics.collectJobs(jobs, options, processes):
+        if error is not None:
+            printerr('FAILED {}: {}', key, error)
+        for diag in diags:
+            printDiagnostic(diag, args.json)
@@ -0,0 +1,34 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+#!/usr/bin/python
+
+import fixer
+import snapshot
+from fileprinter import printf
+
+if __name__ == '__main__':
+    util = fixer.Fixer('Save a compact snapshot of a C++ file\'s AST, which the '
+                       'fixers can analyze later (--from-snapshot) without libclang.')
+    util.add_argument('--output', '-o', dest='output', action='store',
+                      help='Where to write the snapshot. Default is <file>.snapshot')
+    args, transUnit = util.setup()
+
+    output = args.output or util.filepath + '.snapshot'
+    taken = snapshot.export(transUnit)
+    snapshot.save(taken, output)
+    printf('Wrote {} ({} cursors, {} strings)', output, len(taken), len(taken.strings))
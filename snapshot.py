@@ -0,0 +1,506 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# A compact, columnar copy of a translation unit: everything the fixers look
+# at, pulled out of libclang in one traversal and kept as parallel arrays of
+# integers (one element per cursor, in traversal order) plus a table of
+# strings. A snapshot can be saved to a file and loaded again later, and the
+# fixers can run over it without libclang ever being loaded.
+#
+# Cursor i's columns are:
+#
+#     kinds[i]          CursorKind value
+#     parents[i]        index of the lexical parent (the cursor it's within),
+#                       or -1 for the root
+#     semanticParents[i] index of the semantic parent, or -1 if there's none or
+#                       it isn't in here
+#     subtreeEnds[i]    index just past the last of i's descendants
+#     starts[i]         extent start offset
+#     ends[i]           extent end offset
+#     files[i]          index into .files of the location's file, or -1
+#     offsets[i]        location offset
+#     lines[i]          location line
+#     columns[i]        location column
+#     flags[i]          IN_SYSTEM_HEADER
+#     definitions[i]    index of the definition, or -1 if it isn't in here
+#     usrs[i]           index into .strings of the USR
+#     spellings[i]      index into .strings of the spelling
+#     displaynames[i]   index into .strings of the display name
+#
+# Since the cursors are in traversal order, the descendants of cursor i are
+# exactly the cursors in [i + 1, subtreeEnds[i]).
+#
+# The tokens of each file that has cursors, and the diagnostics, are columns
+# too (see _tokenColumns and _diagnosticColumns).
+#
+# Snapshots are saved as a columnfile, so loading one is an mmap and a copy
+# per column.
+#
+
+from array import array
+
+import columnfile
+import clangwrapper # for the side effect of telling clang where libclang is
+from clang.cindex import CursorKind, TokenKind
+from observer import Observer, traverse, FileFilter, scopeKinds
+from columnfile import asStr
+from tokenindex import TokenIndex, TranslationUnitTokens
+
+IN_SYSTEM_HEADER = 1
+
+_magic = 'FCWSNAP2'
+
+_cursorColumns = ['kinds', 'parents', 'semanticParents', 'subtreeEnds',
+                  'starts', 'ends', 'files', 'offsets', 'lines', 'columns',
+                  'flags', 'definitions', 'usrs', 'spellings', 'displaynames']
+
+_tokenColumns = ['tokenFiles', 'tokenStarts', 'tokenEnds', 'tokenKinds',
+                 'tokenSpellings']
+
+_diagnosticColumns = ['diagnosticSeverities', 'diagnosticFiles',
+                      'diagnosticOffsets', 'diagnosticLines',
+                      'diagnosticColumns', 'diagnosticOptions',
+                      'diagnosticSpellings']
+
+_columnNames = _cursorColumns + _tokenColumns + _diagnosticColumns
+
+# Assigns each distinct string the next index, as it's first seen.
+#
+class _Interner(object):
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def __call__(self, s):
+        index = self._ids.get(s)
+        if index is None:
+            index = len(self.strings)
+            self._ids[s] = index
+            self.strings.append(s)
+        return index
+
+# The Observer that does the exporting. Cursors are numbered in the order
+# they're observed.
+#
+class _Exporter(Observer):
+    def __init__(self, columns, files, strings):
+        super(_Exporter, self).__init__()
+        self.columns = columns
+        self._files = files
+        self._strings = strings
+        self._stack = []        # indices of the cursors we're within
+        self._indices = {}      # cursor --> index
+        self._definitions = []  # the definition cursor of each, or None
+        self._semanticParents = [] # the semantic parent of each, or None
+
+    def observe(self, cursor):
+        columns = self.columns
+        index = len(columns['kinds'])
+        self._indices[cursor] = index
+
+        location = cursor.location
+        fileName = cursor.fileName
+
+        columns['kinds'].append(cursor.kind.value)
+        columns['parents'].append(self._stack[-1] if self._stack else -1)
+        columns['subtreeEnds'].append(-1) # filled in by popTo
+        columns['starts'].append(cursor.startOffset)
+        columns['ends'].append(cursor.endOffset)
+        columns['files'].append(-1 if fileName is None else self._files(fileName))
+        columns['offsets'].append(location.offset)
+        columns['lines'].append(location.line)
+        columns['columns'].append(location.column)
+        columns['flags'].append(IN_SYSTEM_HEADER if location.is_in_system_header else 0)
+        columns['usrs'].append(self._strings(cursor.get_usr() or ''))
+        columns['spellings'].append(self._strings(cursor.spelling or ''))
+        columns['displaynames'].append(self._strings(cursor.displayname or ''))
+        self._definitions.append(cursor.get_definition())
+        self._semanticParents.append(cursor.semantic_parent)
+
+    def pushFrom(self, cursor):
+        self._stack.append(len(self.columns['kinds']) - 1)
+
+    def popTo(self, cursor):
+        self.columns['subtreeEnds'][self._stack.pop()] = len(self.columns['kinds'])
+
+    # Definitions can come after the cursors that refer to them, and so can
+    # semantic parents (a member defined out of line, before its class is
+    # seen through some other file), so they're resolved to indices only
+    # once everything has been seen.
+    #
+    def finish(self):
+        for name, cursors in (('definitions', self._definitions),
+                              ('semanticParents', self._semanticParents)):
+            column = self.columns[name]
+            for cursor in cursors:
+                if cursor is None:
+                    column.append(-1)
+                else:
+                    column.append(self._indices.get(cursor, -1))
+
+def _emptyColumns():
+    return dict((name, array('i')) for name in _columnNames)
+
+def _exportTokens(transUnit, columns, filenames, strings):
+    for fileId, filename in enumerate(filenames):
+        tokens = TokenIndex.fromTranslationUnit(transUnit, filename)
+        for i in xrange(len(tokens)):
+            columns['tokenFiles'].append(fileId)
+            columns['tokenStarts'].append(tokens.starts[i])
+            columns['tokenEnds'].append(tokens.ends[i])
+            columns['tokenKinds'].append(tokens.kinds[i].value)
+            columns['tokenSpellings'].append(strings(tokens.spellings[i]))
+
+def _exportDiagnostics(transUnit, columns, files, strings):
+    for diag in transUnit.diagnostics:
+        location = diag.location
+        file = location.file
+        columns['diagnosticSeverities'].append(diag.severity)
+        columns['diagnosticFiles'].append(-1 if file is None else files(file.name))
+        columns['diagnosticOffsets'].append(location.offset)
+        columns['diagnosticLines'].append(location.line)
+        columns['diagnosticColumns'].append(location.column)
+        columns['diagnosticOptions'].append(strings(diag.option or ''))
+        columns['diagnosticSpellings'].append(strings(diag.spelling or ''))
+
+# Take a Snapshot of 'transUnit' in one traversal. By default, system
+# headers are left out (they're most of any translation unit, and none of
+# the fixers touch them).
+#
+def export(transUnit, fileFilter=FileFilter()):
+    columns = _emptyColumns()
+    files = _Interner()
+    strings = _Interner()
+
+    exporter = _Exporter(columns, files, strings)
+    traverse(transUnit.cursor, exporter, fileFilter)
+    exporter.finish()
+
+    # Only the files that have cursors get tokenized; the diagnostics can
+    # add more files after that.
+    _exportTokens(transUnit, columns, list(files.strings), strings)
+    _exportDiagnostics(transUnit, columns, files, strings)
+
+    return Snapshot(transUnit.spelling, files.strings, strings.strings, columns)
+
+def save(snapshot, path):
+    columnfile.save(path,
+                    _magic,
+                    {'spelling': snapshot.spelling,
+                     'files': snapshot.fileNames,
+                     'strings': snapshot.strings},
+                    [(name, snapshot.columns[name]) for name in _columnNames])
+
+def load(path):
+    header, columns = columnfile.load(path, _magic)
+    return Snapshot(asStr(header['spelling']),
+                    [asStr(name) for name in header['files']],
+                    [asStr(s) for s in header['strings']],
+                    columns)
+
+# The stand-ins for the clang.cindex classes, having just enough of their
+# interface for the fixers.
+#
+class SnapshotFile(object):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '<SnapshotFile: {}>'.format(self.name)
+
+class SnapshotLocation(object):
+    __slots__ = ('file', 'line', 'column', 'offset', 'is_in_system_header')
+
+    def __init__(self, file, line, column, offset, inSystemHeader=False):
+        self.file = file
+        self.line = line
+        self.column = column
+        self.offset = offset
+        self.is_in_system_header = inSystemHeader
+
+    def _key(self):
+        return (None if self.file is None else self.file.name, self.offset)
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return '<SnapshotLocation file {!r}, line {}, column {}>'.format(
+            None if self.file is None else self.file.name, self.line, self.column)
+
+class SnapshotExtent(object):
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return '<SnapshotExtent start {!r}, end {!r}>'.format(self.start, self.end)
+
+class SnapshotDiagnostic(object):
+    __slots__ = ('severity', 'location', 'option', 'spelling', 'fixits')
+
+    def __init__(self, severity, location, option, spelling):
+        self.severity = severity
+        self.location = location
+        self.option = option
+        self.spelling = spelling
+        self.fixits = [] # not kept
+
+    def __repr__(self):
+        return '<Diagnostic severity {}, location {}, spelling {!r}>'.format(
+            self.severity, self.location, self.spelling)
+
+# A cursor is nothing but a snapshot and an index into its columns. Two of
+# them are equal if they're the same cursor of the same snapshot, and the
+# index doubles as the hash.
+#
+class SnapshotCursor(object):
+    __slots__ = ('_snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self.index = index
+
+    def __eq__(self, other):
+        other = getattr(other, 'cursor', other) # a clangwrapper.CachedCursor
+        return isinstance(other, SnapshotCursor) \
+           and other.index == self.index \
+           and other._snapshot is self._snapshot
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.index
+
+    @property
+    def hash(self):
+        return self.index
+
+    @property
+    def kind(self):
+        return CursorKind.from_id(self._snapshot.columns['kinds'][self.index])
+
+    @property
+    def _kind_id(self):
+        return self._snapshot.columns['kinds'][self.index]
+
+    @property
+    def spelling(self):
+        return self._snapshot.strings[self._snapshot.columns['spellings'][self.index]]
+
+    @property
+    def displayname(self):
+        return self._snapshot.strings[self._snapshot.columns['displaynames'][self.index]]
+
+    def get_usr(self):
+        return self._snapshot.strings[self._snapshot.columns['usrs'][self.index]]
+
+    @property
+    def location(self):
+        columns = self._snapshot.columns
+        i = self.index
+        return SnapshotLocation(self._snapshot.file(columns['files'][i]),
+                                columns['lines'][i],
+                                columns['columns'][i],
+                                columns['offsets'][i],
+                                bool(columns['flags'][i] & IN_SYSTEM_HEADER))
+
+    # What a clangwrapper.CachedCursor answers to, which is nothing but a
+    # lookup here anyway.
+    #
+    @property
+    def fileName(self):
+        file = self._snapshot.file(self._snapshot.columns['files'][self.index])
+        return None if file is None else file.name
+
+    @property
+    def startOffset(self):
+        return self._snapshot.columns['starts'][self.index]
+
+    @property
+    def endOffset(self):
+        return self._snapshot.columns['ends'][self.index]
+
+    # Only the offsets of the extent are kept.
+    #
+    @property
+    def extent(self):
+        columns = self._snapshot.columns
+        file = self._snapshot.file(columns['files'][self.index])
+        return SnapshotExtent(
+            SnapshotLocation(file, None, None, columns['starts'][self.index]),
+            SnapshotLocation(file, None, None, columns['ends'][self.index]))
+
+    def get_definition(self):
+        definition = self._snapshot.columns['definitions'][self.index]
+        return None if definition == -1 else self._snapshot.cursorAt(definition)
+
+    @property
+    def semantic_parent(self):
+        parent = self._snapshot.columns['semanticParents'][self.index]
+        return None if parent == -1 else self._snapshot.cursorAt(parent)
+
+    @property
+    def lexical_parent(self):
+        parent = self._snapshot.columns['parents'][self.index]
+        return None if parent == -1 else self._snapshot.cursorAt(parent)
+
+    def get_children(self):
+        subtreeEnds = self._snapshot.columns['subtreeEnds']
+        child = self.index + 1
+        end = subtreeEnds[self.index]
+        while child < end:
+            yield self._snapshot.cursorAt(child)
+            child = subtreeEnds[child]
+
+    # What observer.traverse does for a SnapshotCursor.
+    #
+    def traverse(self, observer, fileFilter=None):
+        self._snapshot.traverse(observer, fileFilter, self.index)
+
+    def __repr__(self):
+        return '<SnapshotCursor {} {}>'.format(self.index, self.kind)
+
+# The stand-in for a clang.cindex.TranslationUnit.
+#
+class Snapshot(object):
+    def __init__(self, spelling, fileNames, strings, columns):
+        self.spelling = spelling
+        self.fileNames = fileNames
+        self.strings = strings
+        self.columns = columns
+        self._files = [SnapshotFile(name) for name in fileNames]
+        self._tokens = None
+        self._diagnostics = None
+
+    def __len__(self):
+        return len(self.columns['kinds'])
+
+    def file(self, fileId):
+        return None if fileId == -1 else self._files[fileId]
+
+    def cursorAt(self, index):
+        return SnapshotCursor(self, index)
+
+    # The innermost cursor whose extent contains 'location', or None; what
+    # clang_getCursor is for a translation unit. Each level down skips over
+    # the siblings that don't contain it.
+    #
+    def cursorAtLocation(self, location):
+        if location.file is None or location.file.name not in self.fileNames:
+            return None
+        fileId = self.fileNames.index(location.file.name)
+        offset = location.offset
+        columns = self.columns
+        files, starts, ends = columns['files'], columns['starts'], columns['ends']
+        subtreeEnds = columns['subtreeEnds']
+
+        found = None
+        i, end = 1, len(self)
+        while i < end:
+            if files[i] == fileId and starts[i] <= offset < ends[i]:
+                found = i
+                i, end = i + 1, subtreeEnds[i]
+            else:
+                i = subtreeEnds[i]
+        return None if found is None else self.cursorAt(found)
+
+    @property
+    def cursor(self):
+        return self.cursorAt(0)
+
+    @property
+    def diagnostics(self):
+        if self._diagnostics is None:
+            columns = self.columns
+            self._diagnostics = [
+                SnapshotDiagnostic(columns['diagnosticSeverities'][i],
+                                   SnapshotLocation(self.file(columns['diagnosticFiles'][i]),
+                                                    columns['diagnosticLines'][i],
+                                                    columns['diagnosticColumns'][i],
+                                                    columns['diagnosticOffsets'][i]),
+                                   self.strings[columns['diagnosticOptions'][i]],
+                                   self.strings[columns['diagnosticSpellings'][i]]) \
+                for i in xrange(len(columns['diagnosticSeverities']))]
+        return self._diagnostics
+
+    # A tokenindex.TranslationUnitTokens with every file's TokenIndex already
+    # built from the token columns (see tokenindex.tokensFor).
+    #
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            columns = self.columns
+            byFile = [TokenIndex(name, array('l'), array('l'), [], []) \
+                      for name in self.fileNames]
+            for i in xrange(len(columns['tokenFiles'])):
+                index = byFile[columns['tokenFiles'][i]]
+                index.starts.append(columns['tokenStarts'][i])
+                index.ends.append(columns['tokenEnds'][i])
+                index.kinds.append(TokenKind.from_value(columns['tokenKinds'][i]))
+                index.spellings.append(self.strings[columns['tokenSpellings'][i]])
+            self._tokens = TranslationUnitTokens(
+                self, dict((index.filename, index) for index in byFile))
+        return self._tokens
+
+    # The same walk that observer.traverse does, over the columns instead of
+    # libclang. The subtree of cursor 'root' is visited in order; when
+    # 'fileFilter' rejects a child of a scope, the whole subtree of that
+    # child is skipped.
+    #
+    def traverse(self, observer, fileFilter=None, root=0):
+        kinds = self.columns['kinds']
+        parents = self.columns['parents']
+        subtreeEnds = self.columns['subtreeEnds']
+        stack = []
+
+        i = root
+        end = subtreeEnds[root]
+        while i < end:
+            while stack and i >= subtreeEnds[stack[-1].index]:
+                observer.popTo(stack.pop())
+
+            cursor = SnapshotCursor(self, i)
+            if fileFilter is not None \
+               and stack \
+               and kinds[parents[i]] in scopeKinds \
+               and not fileFilter.accepts(cursor):
+                i = subtreeEnds[i]
+                continue
+
+            observer.observe(cursor)
+            observer.pushFrom(cursor)
+            stack.append(cursor)
+            i += 1
+
+        while stack:
+            observer.popTo(stack.pop())
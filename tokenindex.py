@@ -0,0 +1,133 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Cursor.get_tokens tokenizes the cursor's extent every time it's called, and
+# then every look at a token's spelling, kind, or extent is another call into
+# libclang. When you want the tokens of lots of cursors, it's much cheaper to
+# tokenize each file once, copy out everything about its tokens into plain
+# Python arrays sorted by offset, and then find a cursor's tokens by
+# bisecting those.
+#
+
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+# What you get instead of a clang.cindex.Token. It's just data.
+#
+class IndexedToken(object):
+    __slots__ = ('filename', 'startOffset', 'endOffset', 'kind', 'spelling')
+
+    def __init__(self, filename, startOffset, endOffset, kind, spelling):
+        self.filename = filename
+        self.startOffset = startOffset
+        self.endOffset = endOffset
+        self.kind = kind
+        self.spelling = spelling
+
+    def __repr__(self):
+        return '<IndexedToken "{}" {}({}-{})>'.format(self.spelling,
+                                                      self.filename,
+                                                      self.startOffset,
+                                                      self.endOffset)
+
+# All of the tokens in one file, as parallel arrays sorted by offset.
+#
+class TokenIndex(object):
+    def __init__(self, filename, starts, ends, kinds, spellings):
+        self.filename = filename
+        self.starts = starts
+        self.ends = ends
+        self.kinds = kinds # of clang.cindex.TokenKind
+        self.spellings = spellings
+
+    @staticmethod
+    def fromTranslationUnit(transUnit, filename):
+        index = TokenIndex(filename, array('l'), array('l'), [], [])
+        extent = transUnit.get_extent(filename, (0, os.path.getsize(filename)))
+        for token in transUnit.get_tokens(extent=extent):
+            tokenExtent = token.extent
+            index.starts.append(tokenExtent.start.offset)
+            index.ends.append(tokenExtent.end.offset)
+            index.kinds.append(token.kind)
+            index.spellings.append(token.spelling)
+        return index
+
+    def __len__(self):
+        return len(self.starts)
+
+    def token(self, i):
+        return IndexedToken(self.filename,
+                            self.starts[i],
+                            self.ends[i],
+                            self.kinds[i],
+                            self.spellings[i])
+
+    # The range of indices of the tokens lying entirely within
+    # [startOffset, endOffset].
+    #
+    def indicesBetween(self, startOffset, endOffset):
+        begin = bisect_left(self.starts, startOffset)
+        end = bisect_right(self.ends, endOffset)
+        return begin, max(begin, end)
+
+    # The range of indices of the tokens that start within
+    # [startOffset, endOffset].
+    #
+    def indicesStartingBetween(self, startOffset, endOffset):
+        begin = bisect_left(self.starts, startOffset)
+        end = bisect_right(self.starts, endOffset)
+        return begin, max(begin, end)
+
+    def tokensBetween(self, startOffset, endOffset):
+        begin, end = self.indicesBetween(startOffset, endOffset)
+        return [self.token(i) for i in xrange(begin, end)]
+
+# The TokenIndex of each file of a translation unit, built the first time
+# it's asked for (unless they're all handed over up front).
+#
+class TranslationUnitTokens(object):
+    def __init__(self, transUnit, indexes=None):
+        self.transUnit = transUnit
+        self._indexes = dict(indexes or {}) # filename --> TokenIndex
+
+    def indexOf(self, filename):
+        index = self._indexes.get(filename)
+        if index is None:
+            index = TokenIndex.fromTranslationUnit(self.transUnit, filename)
+            self._indexes[filename] = index
+        return index
+
+    # Same as list(cursor.get_tokens()), but without tokenizing anything
+    # after the first time a file is seen.
+    #
+    # 'cursor' is a clangwrapper.CachedCursor (or a snapshot.SnapshotCursor).
+    #
+    def tokensOf(self, cursor):
+        fileName = cursor.fileName
+        if fileName is None:
+            return []
+        return self.indexOf(fileName).tokensBetween(cursor.startOffset,
+                                                    cursor.endOffset)
+
+# The tokens of 'transUnit'. A snapshot.Snapshot brings its own, since it
+# can't tokenize anything.
+#
+def tokensFor(transUnit):
+    tokens = getattr(transUnit, 'tokens', None)
+    return tokens if tokens is not None else TranslationUnitTokens(transUnit)
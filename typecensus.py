@@ -0,0 +1,159 @@
+'''
+    FixCppWarnings - Automated C++ rewriting for common compiler warnings
+    Copyright (C) 2015  David Goffredo
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# A census of the types in translation units: each distinct type, how many
+# cursors have it, and in how many translation units. Used by show-types.py.
+#
+# Types are told apart by their canonical type's kind and spelling, e.g.
+# ('RECORD', 'const ns::Foo'), so a typedef counts as the type it names, and
+# the same type is the same key in every translation unit. (The USR of the
+# type's declaration wouldn't do: 'const Foo', 'Foo *' and 'Foo' would be
+# one type, or pointers would have no key at all.) Looking a type up
+# is a dict lookup, rather than comparing it (in libclang) with every type
+# seen so far.
+#
+
+import multiprocessing
+import os
+from collections import Counter
+
+import fixer
+import incremental
+from clangwrapper import Index, TranslationUnitLoadError, TypeKind
+from observer import Observer, traverse
+
+# The key of 'cppType' in a TypeCensus.
+#
+def typeKey(cppType):
+    canonical = cppType.get_canonical()
+    return (canonical.kind.name, canonical.spelling)
+
+class TypeCensus(object):
+    def __init__(self):
+        self.counts = Counter()       # key --> number of cursors of that type
+        self.units = Counter()        # key --> number of translation units
+        self.refQualifiers = {}       # key --> name of the RefQualifierKind
+        self.translationUnits = 0
+
+    def add(self, cppType):
+        key = typeKey(cppType)
+        if key not in self.counts:
+            self.units[key] = 1
+            self.refQualifiers[key] = cppType.get_ref_qualifier().name
+        self.counts[key] += 1
+
+    # Add in the census of other translation units.
+    #
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.units.update(other.units)
+        for key, refQualifier in other.refQualifiers.iteritems():
+            self.refQualifiers.setdefault(key, refQualifier)
+        self.translationUnits += other.translationUnits
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    # (key, count) for each type, the most common first.
+    #
+    def mostCommon(self):
+        return sorted(self.counts.iteritems(), key=lambda item: (-item[1], item[0]))
+
+# Counts the type of every cursor observed. Cursors with no type (most
+# statements, for example) are left out.
+#
+class TypeGrabber(Observer):
+    def __init__(self, census, whitelist=set()):
+        super(TypeGrabber, self).__init__()
+        self.census = census
+        self.whitelist = whitelist
+
+    def _ignore(self, c):
+        return len(self.whitelist) > 0 \
+            and (c.fileName or '') not in self.whitelist
+
+    def observe(self, c):
+        if self._ignore(c):
+            return
+        cppType = c.type
+        if cppType.kind != TypeKind.INVALID:
+            self.census.add(cppType)
+
+def censusOf(transUnit, fileFilter=None, whitelist=set()):
+    census = TypeCensus()
+    census.translationUnits = 1
+    traverse(transUnit.cursor, TypeGrabber(census, whitelist), fileFilter)
+    return census
+
+# Taking the census of the translation units of a compilation database is
+# done across a pool of workers the same way as in batch.py. Each worker
+# sends back the census of one translation unit, and they're merged as they
+# come.
+#
+_index = None
+
+def _initWorker():
+    global _index
+    _index = Index.create()
+
+def censusJob(job, fileFilter=None):
+    directory, filepath, flags = job
+    key = incremental.unitKey(directory, filepath)
+    try:
+        os.chdir(directory)
+        transUnit = fixer.getTranslationUnit(filepath,
+                                             fixer.hardcodedFlags + flags,
+                                             _index)
+    except TranslationUnitLoadError as error:
+        return key, None, str(error)
+    return key, censusOf(transUnit, fileFilter), None
+
+# Pool.imap wants a function of one argument.
+#
+def _censusJobWithFilter(jobAndFilter):
+    return censusJob(*jobAndFilter)
+
+# The census of all of 'jobs' (see batch.getJobs), and a list of (key,
+# error message) for those that couldn't be parsed.
+#
+def censusOfJobs(jobs, processes, fileFilter=None):
+    work = [(job, fileFilter) for job in jobs]
+    if processes == 1:
+        _initWorker()
+        results = (_censusJobWithFilter(item) for item in work)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_initWorker)
+        results = pool.imap_unordered(_censusJobWithFilter, work)
+
+    total = TypeCensus()
+    failures = []
+    try:
+        for key, census, error in results:
+            if error is not None:
+                failures.append((key, error))
+            else:
+                total.merge(census)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return total, failures